@@ -27,12 +27,15 @@ func addResourceEvent(
 		panic(fmt.Sprintf("Unexpected resource type %T!\n", resType))
 	}
 	var eventID int
+	// The event inherits the visibility of the resource, which is kept in
+	// sync by the resource update webhooks.
 	event_id := tx.QueryRowContext(ctx, fmt.Sprintf(`
 		INSERT INTO event (
-			created, event_type, %s_id, user_id
-		) VALUES (
-			NOW() at time zone 'utc', $1, $2, $3
-		) RETURNING id;`, prefix),
+			created, event_type, %[1]s_id, user_id, visibility
+		) SELECT
+			NOW() at time zone 'utc', $1, $2, $3, visibility
+		FROM %[1]s WHERE id = $2
+		RETURNING id;`, prefix),
 		fmt.Sprintf("%s_added", prefix), resID, userID)
 	if err := event_id.Scan(&eventID); err != nil {
 		return err
@@ -1,8 +1,8 @@
 import json
 from flask import Blueprint, render_template, request, redirect, url_for, abort
 from hubsrht.projects import ProjectAccess, get_project, get_project_or_redir
-from hubsrht.services.hub import HubClient
-from hubsrht.services.lists import ListsClient, Visibility as ListVisibility
+from hubsrht.remote import list_remote
+from hubsrht.transport import pooled, render_timeout
 from hubsrht.types import MailingList, Visibility
 from srht.app import paginate_query
 from srht.config import get_origin
@@ -16,26 +16,15 @@ mailing_lists = Blueprint("mailing_lists", __name__)
 
 LIST_WEBHOOK_VERSION = 6
 
-def get_user_lists(project, client, search=None):
-    # TODO: Pagination
-    cursor = None
-    lists = []
-    while True:
-        batch = client.get_lists(cursor).me.lists
-        lists.extend(batch.results)
-        cursor = batch.cursor
-        if not cursor:
-            break
-
-    lists = sorted(lists, key=lambda r: r.updated, reverse=True)
+def get_user_lists(project, search=None):
+    from hubsrht.services.lists import ListsClient
+    client = pooled(ListsClient, timeout=render_timeout)
+    lists, more = list_remote(
+        lambda cursor: client.get_lists(cursor).me.lists,
+        search=search)
     existing = [l.remote_id for l in (MailingList.query
             .filter(MailingList.project_id == project.id)).all()]
-
-    if search:
-        # TODO: Better searching
-        lists = [l for l in lists if search.lower() in l.name.lower()]
-
-    return (lists, existing)
+    return (lists, existing, more)
 
 @mailing_lists.route("/<owner>/<project_name>/lists")
 def lists_GET(owner, project_name):
@@ -66,13 +55,14 @@ def lists_GET(owner, project_name):
 @loginrequired
 def new_GET(owner, project_name):
     owner, project = get_project_or_redir(owner, project_name, ProjectAccess.write)
-    client = ListsClient()
-    lists, existing = get_user_lists(project, client)
+    lists, existing, more = get_user_lists(project)
     return render_template("mailing-list-new.html", view="new-resource",
-            owner=owner, project=project, lists=lists, existing=existing)
+            owner=owner, project=project, lists=lists, existing=existing,
+            more=more)
 
 def finalize_add_list(client, owner, project, mailing_list):
-    HubClient().link_mailing_list(to_rid(project.rid), mailing_list.rid)
+    from hubsrht.services.hub import HubClient
+    pooled(HubClient).link_mailing_list(to_rid(project.rid), mailing_list.rid)
 
 def lists_from_template(owner, project, template):
     project_url = url_for("projects.summary_GET",
@@ -114,7 +104,8 @@ Mailing list for end-user discussion and questions related to the
     }
     template = templates[template]
 
-    client = ListsClient()
+    from hubsrht.services.lists import ListsClient, Visibility as ListVisibility
+    client = pooled(ListsClient)
 
     for list_name in template:
         desc = descs[list_name]
@@ -139,11 +130,12 @@ Mailing list for end-user discussion and questions related to the
 @mailing_lists.route("/<owner>/<project_name>/lists/new", methods=["POST"])
 @loginrequired
 def new_POST(owner, project_name):
+    from hubsrht.services.lists import ListsClient, Visibility as ListVisibility
     owner, project = get_project(owner, project_name, ProjectAccess.write)
     if project is None:
         abort(404)
 
-    client = ListsClient()
+    client = pooled(ListsClient)
     valid = Validation(request)
 
     if "from-template" in valid:
@@ -152,10 +144,10 @@ def new_POST(owner, project_name):
                 "announce-devel", "announce-devel-discuss"],
             "Invalid template selection")
         if not valid.ok:
-            lists, existing = get_user_lists(project, client)
+            lists, existing, more = get_user_lists(project)
             return render_template("mailing-list-new.html", view="new-resource",
                     owner=owner, project=project, lists=lists,
-                    existing=existing, **valid.kwargs)
+                    existing=existing, more=more, **valid.kwargs)
         return lists_from_template(owner, project, template)
     elif "create" in valid:
         with valid:
@@ -165,10 +157,10 @@ def new_POST(owner, project_name):
                 visibility=ListVisibility(project.visibility.value)
             ).mailing_list
         if not valid.ok:
-            lists, existing = get_user_lists(project, client)
+            lists, existing, more = get_user_lists(project)
             return render_template("mailing-list-new.html", view="new-resource",
                     owner=owner, project=project, lists=lists,
-                    existing=existing, **valid.kwargs)
+                    existing=existing, more=more, **valid.kwargs)
     else:
         list_rid = None
         for field in valid.source:
@@ -177,10 +169,10 @@ def new_POST(owner, project_name):
                 break
         if not list_rid:
             search = valid.optional("search")
-            lists, existing = get_user_lists(project, client, search)
+            lists, existing, more = get_user_lists(project, search)
             return render_template("mailing-list-new.html", view="new-resource",
                     owner=owner, project=project, lists=lists,
-                    existing=existing, **valid.kwargs)
+                    existing=existing, more=more, **valid.kwargs)
         mailing_list = client.get_list(list_rid).mailing_list
 
     finalize_add_list(client, owner, project, mailing_list)
@@ -227,6 +219,8 @@ def delete_GET(owner, project_name, list_id):
         methods=["POST"])
 @loginrequired
 def delete_POST(owner, project_name, list_id):
+    from hubsrht.services.hub import HubClient
+    from hubsrht.services.lists import ListsClient
     owner, project = get_project(owner, project_name, ProjectAccess.write)
     if project is None:
         abort(404)
@@ -236,12 +230,12 @@ def delete_POST(owner, project_name, list_id):
     if not mailing_list:
         abort(404)
 
-    HubClient().unlink_mailing_list(to_rid(project.rid), mailing_list.remote_rid)
+    pooled(HubClient).unlink_mailing_list(to_rid(project.rid), mailing_list.remote_rid)
 
     valid = Validation(request)
     delete_remote = valid.optional("delete-remote") == "on"
     if delete_remote:
-        ListsClient().delete_list(mailing_list.remote_id)
+        pooled(ListsClient).delete_list(mailing_list.remote_id)
 
     return redirect(url_for("projects.summary_GET",
         owner=owner.canonical_name, project_name=project.name))
@@ -1,25 +1,24 @@
+import hashlib
 import re
 import string
+from datetime import timezone
 from flask import Blueprint, Response, render_template, request, redirect, url_for
 from flask import session, abort, make_response
 from hubsrht.decorators import adminrequired
+from hubsrht.pagecache import invalidate_pages
 from hubsrht.projects import ProjectAccess, get_project, get_project_or_redir
-from hubsrht.services.git import GitClient
-from hubsrht.services.hg import HgClient
-from hubsrht.services.hub import HubClient, ProjectInput
+from hubsrht.readme import get_cached_readme
+from hubsrht.transport import pooled
 from hubsrht.types import Feature, Event, EventType
 from hubsrht.types import Project, RepoType, Visibility
-from hubsrht.types import SourceRepo, MailingList, Tracker
+from hubsrht.types import SourceRepo
 from hubsrht.types.eventprojectassoc import EventProjectAssociation
-from markupsafe import Markup, escape
-from sqlalchemy import or_
+from sqlalchemy import tuple_
 from sqlalchemy.sql import text
 from srht.app import csrf_bypass, paginate_query
 from srht.config import cfg, get_origin
 from srht.database import db
-from srht.graphql import InternalAuth
 from srht.oauth import current_user, loginrequired
-from srht.markdown import markdown, sanitize
 from srht.rid import to_rid
 from srht.validation import Validation, valid_url
 
@@ -49,44 +48,44 @@ To browse all of the available repositories for this project, visit this URL:
       owner=owner.canonical_name, project_name=project.name)}
 """
 
-def get_readme(owner, repo):
-    auth = InternalAuth(owner)
-    html, plaintext, md = None, None, None
-
-    if repo.repo_type == RepoType.git:
-        blob_prefix = repo.url() + "/blob/HEAD/"
-        rendered_prefix = repo.url() + "/tree/HEAD/"
-
-        client = GitClient(auth)
-        git_repo = client.get_readme(owner.username, repo.name).user.repository
-        if not git_repo:
-            raise Exception(f"git.sr.ht returned no repository for {owner.username}/{repo.name}")
-        html = git_repo.html
-        if git_repo.plaintext:
-            plaintext = git_repo.plaintext.object.text
-        if git_repo.md or git_repo.markdown:
-            md = (git_repo.md or git_repo.markdown).object.text
-    elif repo.repo_type == RepoType.hg:
-        blob_prefix = repo.url() + "/raw/"
-        rendered_prefix = repo.url() + "/browse/"
-
-        client = HgClient(auth)
-        hg_repo = client.get_readme(owner.username, repo.name).user.repository
-        html = hg_repo.html
-        plaintext = hg_repo.plaintext
-        md = hg_repo.md or hg_repo.markdown
-
-    if html:
-        return Markup(sanitize(html))
-
-    if md:
-        html = markdown(md, link_prefix=[rendered_prefix, blob_prefix])
-        return Markup(html)
-
-    if plaintext:
-        return Markup(f"<pre>{escape(plaintext)}</pre>")
-
-    return None
+def get_project_events(owner, project):
+    """
+    Returns a query for the events of a project which are visible to the
+    current user, without any ordering applied.
+    """
+    events = (Event.query
+        .join(EventProjectAssociation)
+        .filter(EventProjectAssociation.project_id == project.id))
+    if not current_user or current_user.id != owner.id:
+        events = events.filter(Event.visibility == Visibility.PUBLIC)
+    return events
+
+FEED_PAGE_SIZE = 15
+
+def paginate_events(events):
+    """
+    Paginates an event query with a keyset on (created, id), so that deep
+    pages cost the same as the first one. The ?before= argument is the ID of
+    the last event of the previous page.
+    """
+    before = request.args.get("before", type=int)
+    if before is not None:
+        cursor = (db.session.query(Event.created, Event.id)
+            .filter(Event.id == before)).one_or_none()
+        if cursor is None:
+            abort(400)
+        events = events.filter(
+            tuple_(Event.created, Event.id) < tuple_(*cursor))
+
+    events = (events
+        .options(*Event.load_details())
+        .order_by(Event.created.desc(), Event.id.desc())
+        .limit(FEED_PAGE_SIZE + 1)).all()
+    next_cursor = None
+    if len(events) > FEED_PAGE_SIZE:
+        events = events[:FEED_PAGE_SIZE]
+        next_cursor = events[-1].id
+    return events, { "before": before, "next_cursor": next_cursor }
 
 @projects.route("/<owner>/<project_name>/")
 def summary_GET(owner, project_name):
@@ -109,26 +108,17 @@ def summary_GET(owner, project_name):
     if project.summary_repo_id is not None:
         repo = project.summary_repo
         try:
-            summary = get_readme(owner, repo)
+            summary = get_cached_readme(owner, repo)
         except Exception as ex:
             print('Error fetching README for {}/{}: {}: {}'.format(
                 owner.canonical_name, project_name, type(ex).__name__, ex))
             summary = None
             summary_error = True
 
-    events = (Event.query
-        .outerjoin(EventProjectAssociation)
-        .filter(EventProjectAssociation.project_id == project.id)
-        .order_by(Event.created.desc()))
-    if not current_user or current_user.id != owner.id:
-        events = (events
-            .outerjoin(SourceRepo)
-            .outerjoin(MailingList)
-            .outerjoin(Tracker)
-            .filter(or_(Event.source_repo == None, SourceRepo.visibility == Visibility.PUBLIC),
-                or_(Event.mailing_list == None, MailingList.visibility == Visibility.PUBLIC),
-                or_(Event.tracker == None, Tracker.visibility == Visibility.PUBLIC)))
-    events = events.limit(2).all()
+    events = (get_project_events(owner, project)
+        .options(*Event.load_details())
+        .order_by(Event.created.desc(), Event.id.desc())
+        .limit(2)).all()
 
     return render_template("project-summary.html", view="summary",
             owner=owner, project=project,
@@ -156,63 +146,93 @@ def summary_refs(owner, project_name):
     else:
         abort(404)
 
+def feed_validators(project, events):
+    """
+    Returns an ETag and last modification time for a page of a project feed,
+    derived from the newest visible event and the project itself, without
+    loading the feed.
+    """
+    newest = (events
+        .order_by(Event.created.desc(), Event.id.desc())
+        .with_entities(Event.id, Event.created)
+        .first())
+    last_modified = project.updated
+    if newest and newest.created > last_modified:
+        last_modified = newest.created
+    # The rendered page also depends on who is viewing it and which page
+    viewer = current_user.id if current_user else None
+    key = ":".join([str(project.id), project.updated.isoformat(),
+        str(newest.id if newest else None), str(viewer),
+        request.query_string.decode()])
+    etag = hashlib.sha256(key.encode()).hexdigest()
+    return etag, last_modified.replace(tzinfo=timezone.utc)
+
+def not_modified(etag, last_modified):
+    """Checks the conditional request headers against a feed's validators."""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+def conditional_response(res, etag, last_modified):
+    res.set_etag(etag)
+    res.last_modified = last_modified
+    return res
+
 @projects.route("/<owner>/<project_name>/feed")
 def feed_GET(owner, project_name):
     owner, project = get_project_or_redir(owner, project_name, ProjectAccess.read)
 
-    events = (Event.query
-        .outerjoin(EventProjectAssociation)
-        .filter(EventProjectAssociation.project_id == project.id)
-        .order_by(Event.created.desc()))
-
-    if not current_user or current_user.id != owner.id:
-        events = (events
-            .outerjoin(SourceRepo)
-            .outerjoin(MailingList)
-            .outerjoin(Tracker)
-            .filter(or_(Event.source_repo == None, SourceRepo.visibility == Visibility.PUBLIC),
-                or_(Event.mailing_list == None, MailingList.visibility == Visibility.PUBLIC),
-                or_(Event.tracker == None, Tracker.visibility == Visibility.PUBLIC)))
+    events = get_project_events(owner, project)
+    etag, last_modified = feed_validators(project, events)
+    if not_modified(etag, last_modified):
+        return conditional_response(make_response("", 304),
+                etag, last_modified)
 
-    events, pagination = paginate_query(events)
+    if "page" in request.args:
+        events, pagination = paginate_query(events
+                .options(*Event.load_details())
+                .order_by(Event.created.desc(), Event.id.desc()))
+    else:
+        events, pagination = paginate_events(events)
 
-    return render_template("project-feed.html",
+    res = make_response(render_template("project-feed.html",
             view="summary", owner=owner, project=project,
-            events=events, EventType=EventType, **pagination)
+            events=events, EventType=EventType, **pagination))
+    return conditional_response(res, etag, last_modified)
 
 @projects.route("/<owner>/<project_name>/feed.rss")
 def feed_rss_GET(owner, project_name):
     owner, project = get_project_or_redir(owner, project_name, ProjectAccess.read)
 
-    events = (Event.query
-        .outerjoin(EventProjectAssociation)
-        .filter(EventProjectAssociation.project_id == project.id)
-        .order_by(Event.created.desc()))
-
-    if not current_user or current_user.id != owner.id:
-        events = (events
-            .outerjoin(SourceRepo)
-            .outerjoin(MailingList)
-            .outerjoin(Tracker)
-            .filter(or_(Event.source_repo == None, SourceRepo.visibility == Visibility.PUBLIC),
-                or_(Event.mailing_list == None, MailingList.visibility == Visibility.PUBLIC),
-                or_(Event.tracker == None, Tracker.visibility == Visibility.PUBLIC)))
+    events = get_project_events(owner, project)
+    etag, last_modified = feed_validators(project, events)
+    if not_modified(etag, last_modified):
+        return conditional_response(make_response("", 304),
+                etag, last_modified)
 
-    events, pagination = paginate_query(events)
+    if "page" in request.args:
+        events, pagination = paginate_query(events
+                .options(*Event.load_details())
+                .order_by(Event.created.desc(), Event.id.desc()))
+    else:
+        events, pagination = paginate_events(events)
 
     res = make_response(render_template("project-feed-rss.html",
             view="summary", owner=owner, project=project,
             events=events, EventType=EventType, **pagination))
     res.headers['Content-Type'] = 'text/xml; charset=utf-8'
-    return res
+    return conditional_response(res, etag, last_modified)
 
 @projects.route("/<owner>/<project_name>/dismiss-checklist", methods=["POST"])
 @loginrequired
 def dismiss_checklist_POST(owner, project_name):
+    from hubsrht.services.hub import HubClient, ProjectInput
     owner, project = get_project(owner, project_name, ProjectAccess.write)
     if project is None:
         abort(404)
-    HubClient().update_project(to_rid(project.rid),
+    pooled(HubClient).update_project(to_rid(project.rid),
                                ProjectInput(checklist_complete=True))
     return redirect(url_for("projects.summary_GET",
         owner=current_user.canonical_name,
@@ -242,6 +262,7 @@ def create_GET():
 @projects.route("/projects/create", methods=["POST"])
 @loginrequired
 def create_POST():
+    from hubsrht.services.hub import HubClient
     valid = Validation(request)
     name = valid.require("name")
     description = valid.require("description")
@@ -268,9 +289,11 @@ def create_POST():
         kwargs.pop("tags")
         return render_template("project-create.html", **kwargs, tags=tags)
 
-    project = HubClient().create_project(name, visibility, description, tags).project
+    project = pooled(HubClient).create_project(name, visibility, description, tags).project
     if project == None:
         return render_template("project-create.html", **kwargs, tags=tags)
+    if visibility == Visibility.PUBLIC:
+        invalidate_pages()
 
     return redirect(url_for("projects.summary_GET",
         owner=current_user.canonical_name,
@@ -286,6 +309,7 @@ def config_GET(owner, project_name):
 @projects.route("/<owner>/<project_name>/settings", methods=["POST"])
 @loginrequired
 def config_POST(owner, project_name):
+    from hubsrht.services.hub import HubClient, ProjectInput
     owner, project = get_project(owner, project_name, ProjectAccess.write)
     if project is None:
         abort(404)
@@ -303,7 +327,9 @@ def config_POST(owner, project_name):
 
     project_input = ProjectInput(description=description, tags=tags,
                                  website=website, visibility=visibility)
-    HubClient().update_project(to_rid(project.rid), project_input)
+    pooled(HubClient).update_project(to_rid(project.rid), project_input)
+    if Visibility.PUBLIC in (project.visibility, visibility):
+        invalidate_pages()
 
     return redirect(url_for("projects.summary_GET",
         owner=current_user.canonical_name,
@@ -321,6 +347,7 @@ def settings_rename(owner, project_name):
 @projects.route("/<owner>/<project_name>/settings/rename", methods=["POST"])
 @loginrequired
 def settings_rename_POST(owner, project_name):
+    from hubsrht.services.hub import HubClient, ProjectInput
     owner, project = get_project(owner, project_name, ProjectAccess.write)
     if project is None:
         abort(404)
@@ -332,7 +359,9 @@ def settings_rename_POST(owner, project_name):
                 **valid.kwargs)
 
     project_input = ProjectInput(name=name)
-    HubClient().update_project(to_rid(project.rid), project_input)
+    pooled(HubClient).update_project(to_rid(project.rid), project_input)
+    if project.visibility == Visibility.PUBLIC:
+        invalidate_pages()
     return redirect(url_for("projects.summary_GET", owner=owner, project_name=project.name))
 
 
@@ -346,12 +375,15 @@ def delete_GET(owner, project_name):
 @projects.route("/<owner>/<project_name>/delete", methods=["POST"])
 @loginrequired
 def delete_POST(owner, project_name):
+    from hubsrht.services.hub import HubClient
     owner, project = get_project(owner, project_name, ProjectAccess.write)
     if project is None:
         abort(404)
     session["notice"] = f"{project.name} has been deleted."
 
-    HubClient().delete_project(to_rid(project.rid))
+    pooled(HubClient).delete_project(to_rid(project.rid))
+    if project.visibility == Visibility.PUBLIC:
+        invalidate_pages()
     return redirect(url_for("public.index"))
 
 @projects.route("/<owner>/<project_name>/feature", methods=["POST"])
@@ -369,4 +401,5 @@ def feature_POST(owner, project_name):
         abort(400) # admin-only route, who cares
     db.session.add(feature)
     db.session.commit()
+    invalidate_pages()
     return redirect(url_for("public.project_index"))
@@ -1,14 +1,19 @@
-from sqlalchemy.sql import operators
-from flask import Blueprint, render_template, request, session
+from flask import Blueprint, render_template, request, session, abort
+from hubsrht import transport
+from hubsrht.decorators import adminrequired
+from hubsrht.pagecache import anonymous_cache
+from hubsrht.projects import search_projects, search_rank
 from hubsrht.types import Project, Feature, Event, EventType, Visibility, User
+from hubsrht.types import ProjectTag
+from hubsrht.usercache import user_cache
 from srht.app import paginate_query
 from srht.database import db
 from srht.oauth import UserType, current_user, loginrequired
-from srht.search import search_by
 
 public = Blueprint("public", __name__)
 
 @public.route("/")
+@anonymous_cache
 def index():
     if current_user:
         notice = session.pop("notice", None)
@@ -18,6 +23,7 @@ def index():
                 .limit(5)).all()
         if any(projects):
             events = (Event.query
+                    .options(*Event.load_details())
                     .filter(Event.user_id == current_user.id)
                     .order_by(Event.created.desc())
                     .limit(2)).all()
@@ -41,6 +47,7 @@ def getting_started():
     return render_template("new-user-dashboard.html", notice=notice)
 
 @public.route("/projects")
+@anonymous_cache
 def project_index():
     projects = (Project.query.join(User)
         .filter(User.user_type != UserType.suspended)
@@ -50,11 +57,7 @@ def project_index():
     search_error = None
     if search:
         try:
-            projects = search_by(projects, search,
-                    [Project.name, Project.description],
-                    key_fns={"tag": lambda t:
-                        Project.tags.any(t, operator=operators.ilike_op)},
-                    term_map=lambda t: f"tag:{t[1:]}" if t.startswith("#") else t)
+            projects = search_projects(projects, search)
         except ValueError as e:
             search_error = str(e)
 
@@ -64,6 +67,9 @@ def project_index():
     elif sort and sort == "longest-active":
         projects = projects.order_by((Project.updated - Project.created).desc())
     else:
+        rank = search_rank(search) if search and not search_error else None
+        if rank is not None:
+            projects = projects.order_by(rank.desc())
         projects = projects.order_by(Project.updated.desc())
 
     try:
@@ -83,6 +89,7 @@ def project_index():
             search_keys=["sort"], search_error=search_error)
 
 @public.route("/projects/featured")
+@anonymous_cache
 def featured_projects():
     features = (Feature.query
             .join(Project, Feature.project_id == Project.id)
@@ -92,3 +99,39 @@ def featured_projects():
     features, pagination = paginate_query(features)
     return render_template("featured-projects.html",
             features=features, **pagination)
+
+@public.route("/projects/tags")
+@anonymous_cache
+def project_tags():
+    tags = (ProjectTag.query
+            .order_by(ProjectTag.count.desc(), ProjectTag.tag))
+    tags, pagination = paginate_query(tags, results_per_page=100)
+    return render_template("project-tags.html", tags=tags, **pagination)
+
+@public.route("/projects/tag/<tag>")
+@anonymous_cache
+def project_tag(tag):
+    tag = tag.lower()
+    count = (ProjectTag.query
+            .filter(ProjectTag.tag == tag)
+            .with_entities(ProjectTag.count)).scalar()
+    if not count:
+        abort(404)
+    projects = (Project.query.join(User)
+        .filter(User.user_type != UserType.suspended)
+        .filter(Project.visibility == Visibility.PUBLIC)
+        .filter(Project.search_tags.contains([tag]))
+        .order_by(Project.updated.desc()))
+    projects, pagination = paginate_query(projects)
+    return render_template("project-tag.html", tag=tag, count=count,
+            projects=projects, **pagination)
+
+@public.route("/admin/stats")
+@adminrequired
+def admin_stats():
+    # Statistics are kept per process, so this only describes the worker
+    # which serves the request
+    return {
+        "upstreams": transport.stats(),
+        "user_cache": user_cache.stats(),
+    }
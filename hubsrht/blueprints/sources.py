@@ -1,9 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, abort
 from hubsrht.projects import ProjectAccess, get_project, get_project_or_redir
-from hubsrht.services.hg import HgClient, Visibility as HgVisibility
-from hubsrht.services.hub import HubClient
-from hubsrht.services.git import GitClient, Visibility as GitVisibility
-from hubsrht.services.git import GraphQLClientGraphQLMultiError
+from hubsrht.remote import list_remote
+from hubsrht.transport import pooled, render_timeout
 from hubsrht.types import Event, EventType
 from hubsrht.types import RepoType, SourceRepo, Visibility
 from srht.app import paginate_query
@@ -19,28 +17,22 @@ sources = Blueprint("sources", __name__)
 GIT_WEBHOOK_VERSION = 3
 HG_WEBHOOK_VERSION = 2
 
-def get_repos(owner, project, repo_type):
+def get_repos(owner, project, repo_type, search=None):
+    from hubsrht.services.git import GitClient
+    from hubsrht.services.hg import HgClient
     match repo_type:
         case RepoType.git:
-            client = GitClient()
+            client = pooled(GitClient, timeout=render_timeout)
         case RepoType.hg:
-            client = HgClient()
-
-    # TODO: Pagination
-    cursor = None
-    repos = []
-    while True:
-        batch = client.get_repos(cursor).me.repositories
-        repos.extend(batch.results)
-        cursor = batch.cursor
-        if not cursor:
-            break
-
-    repos = sorted(repos, key=lambda r: r.updated, reverse=True)
+            client = pooled(HgClient, timeout=render_timeout)
+
+    # The search is performed by the upstream service
+    repos, more = list_remote(lambda cursor: client.get_repos(
+        cursor, search=search or None).me.repositories)
     existing = [r.remote_id for r in (SourceRepo.query
             .filter(SourceRepo.project_id == project.id)
             .filter(SourceRepo.repo_type == repo_type)).all()]
-    return repos, existing
+    return repos, existing, more
 
 @sources.route("/<owner>/<project_name>/sources")
 def sources_GET(owner, project_name):
@@ -77,30 +69,32 @@ def new_GET(owner, project_name):
 @loginrequired
 def git_new_GET(owner, project_name):
     owner, project = get_project(owner, project_name, ProjectAccess.write)
-    repos, existing = get_repos(owner, project, RepoType.git)
+    repos, existing, more = get_repos(owner, project, RepoType.git)
     return render_template("sources-select.html",
             view="new-resource", vcs="git",
             owner=owner, project=project, repos=repos, existing=existing,
-            origin=get_origin("git.sr.ht", external=True))
+            more=more, origin=get_origin("git.sr.ht", external=True))
 
 @sources.route("/<owner>/<project_name>/hg/new")
 @loginrequired
 def hg_new_GET(owner, project_name):
     owner, project = get_project(owner, project_name, ProjectAccess.write)
-    repos, existing = get_repos(owner, project, RepoType.hg)
+    repos, existing, more = get_repos(owner, project, RepoType.hg)
     return render_template("sources-select.html",
             view="new-resource", vcs="hg",
             owner=owner, project=project, repos=repos, existing=existing,
-            origin=get_origin("hg.sr.ht", external=True))
+            more=more, origin=get_origin("hg.sr.ht", external=True))
 
 @sources.route("/<owner>/<project_name>/git/new", methods=["POST"])
 @loginrequired
 def git_new_POST(owner, project_name):
+    from hubsrht.services.git import GitClient, Visibility as GitVisibility
+    from hubsrht.services.hub import HubClient
     owner, project = get_project(owner, project_name, ProjectAccess.write)
     if project is None:
         abort(404)
 
-    git_client = GitClient()
+    git_client = pooled(GitClient)
     valid = Validation(request)
     visibility = GitVisibility(project.visibility.value)
 
@@ -110,11 +104,11 @@ def git_new_POST(owner, project_name):
         with valid:
             git_repo = git_client.create_repo(name, visibility, desc).repository
         if not valid.ok:
-            repos, existing = get_repos(owner, project, RepoType.git)
+            repos, existing, more = get_repos(owner, project, RepoType.git)
             return render_template("sources-select.html",
                     view="new-resource", vcs="git",
                     owner=owner, project=project, repos=repos,
-                    existing=existing, **valid.kwargs)
+                    existing=existing, more=more, **valid.kwargs)
     else:
         repo_rid = None
         for field in valid.source:
@@ -124,17 +118,16 @@ def git_new_POST(owner, project_name):
 
         if not repo_rid:
             search = valid.optional("search")
-            repos, existing = get_repos(owner, project, RepoType.git)
-            # TODO: Search properly
-            repos = filter(lambda r: search.lower() in r.name.lower(), repos)
+            repos, existing, more = get_repos(owner, project, RepoType.git,
+                    search=search)
             return render_template("sources-select.html",
                     view="new-resource", vcs="git",
                     owner=owner, project=project, repos=repos,
-                    existing=existing, search=search)
+                    existing=existing, more=more, search=search)
 
-        git_repo = GitClient().get_repo(repo_rid).repository
+        git_repo = pooled(GitClient).get_repo(repo_rid).repository
 
-    repo = HubClient().link_source(to_rid(project.rid), git_repo.rid).source
+    repo = pooled(HubClient).link_source(to_rid(project.rid), git_repo.rid).source
     if repo is None:
         return
 
@@ -144,11 +137,13 @@ def git_new_POST(owner, project_name):
 @sources.route("/<owner>/<project_name>/hg/new", methods=["POST"])
 @loginrequired
 def hg_new_POST(owner, project_name):
+    from hubsrht.services.hg import HgClient, Visibility as HgVisibility
+    from hubsrht.services.hub import HubClient
     owner, project = get_project(owner, project_name, ProjectAccess.write)
     if project is None:
         abort(404)
 
-    hg_client = HgClient()
+    hg_client = pooled(HgClient)
     valid = Validation(request)
     visibility = HgVisibility(project.visibility.value)
 
@@ -158,11 +153,11 @@ def hg_new_POST(owner, project_name):
         with valid:
             hg_repo = hg_client.create_repo(name, visibility, desc).repository
         if not valid.ok:
-            repos, existing = get_repos(owner, project, RepoType.hg)
+            repos, existing, more = get_repos(owner, project, RepoType.hg)
             return render_template("sources-select.html",
                     view="new-resource", vcs="hg",
                     owner=owner, project=project, repos=repos,
-                    existing=existing, **valid.kwargs)
+                    existing=existing, more=more, **valid.kwargs)
     else:
         repo_rid = None
         for field in valid.source:
@@ -172,17 +167,16 @@ def hg_new_POST(owner, project_name):
 
         if not repo_rid:
             search = valid.optional("search")
-            repos, existing = get_repos(owner, project, RepoType.git)
-            # TODO: Search properly
-            repos = filter(lambda r: search.lower() in r.name.lower(), repos)
+            repos, existing, more = get_repos(owner, project, RepoType.hg,
+                    search=search)
             return render_template("sources-select.html",
                     view="new-resource", vcs="hg",
                     owner=owner, project=project, repos=repos,
-                    existing=existing, **valid.kwargs)
+                    existing=existing, more=more, **valid.kwargs)
 
         hg_repo = hg_client.get_repo(repo_rid).repository
 
-    repo = HubClient().link_source(to_rid(project.rid), hg_repo.rid).source
+    repo = pooled(HubClient).link_source(to_rid(project.rid), hg_repo.rid).source
     if repo is None:
         return
 
@@ -245,6 +239,9 @@ def delete_GET(owner, project_name, repo_id):
         methods=["POST"])
 @loginrequired
 def delete_POST(owner, project_name, repo_id):
+    from hubsrht.services.git import GitClient, GraphQLClientGraphQLMultiError
+    from hubsrht.services.hg import HgClient
+    from hubsrht.services.hub import HubClient
     owner, project = get_project(owner, project_name, ProjectAccess.write)
     if project is None:
         abort(404)
@@ -258,7 +255,7 @@ def delete_POST(owner, project_name, repo_id):
         project.summary_repo_id = None
         db.session.commit()
 
-    HubClient().unlink_source(to_rid(project.rid), repo.remote_rid)
+    pooled(HubClient).unlink_source(to_rid(project.rid), repo.remote_rid)
 
     valid = Validation(request)
     delete_remote = valid.optional("delete-remote") == "on"
@@ -266,9 +263,9 @@ def delete_POST(owner, project_name, repo_id):
         try:
             match repo.repo_type:
                 case RepoType.git:
-                    GitClient().delete_repo(repo.remote_id)
+                    pooled(GitClient).delete_repo(repo.remote_id)
                 case RepoType.hg:
-                    HgClient().delete_repo(repo.remote_id)
+                    pooled(HgClient).delete_repo(repo.remote_id)
         except GraphQLClientGraphQLMultiError:
             # This generally occurs if the remote repo (or webhook) was deleted and
             # we didn't hear about it. TODO: Replace me with semantic errors
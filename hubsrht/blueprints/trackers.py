@@ -1,8 +1,8 @@
 from flask import Blueprint, render_template, request, redirect, url_for
 from flask import abort
 from hubsrht.projects import ProjectAccess, get_project, get_project_or_redir
-from hubsrht.services.hub import HubClient
-from hubsrht.services.todo import TodoClient, Visibility as TrackerVisibility
+from hubsrht.remote import list_remote
+from hubsrht.transport import pooled, render_timeout
 from hubsrht.types import Event, EventType, Tracker, Visibility
 from srht.app import paginate_query
 from srht.config import get_origin
@@ -14,7 +14,7 @@ from srht.validation import Validation
 
 trackers = Blueprint("trackers", __name__)
 
-TODO_WEBHOOK_VERSION = 2
+TODO_WEBHOOK_VERSION = 3
 
 @trackers.route("/<owner>/<project_name>/trackers")
 def trackers_GET(owner, project_name):
@@ -39,40 +39,36 @@ def trackers_GET(owner, project_name):
             search=terms, search_error=search_error,
             **pagination)
 
-def get_trackers(owner, project):
-    client = TodoClient()
-
-    # TODO: Pagination
-    cursor = None
-    trackers = []
-    while True:
-        batch = client.get_trackers(cursor).me.trackers
-        trackers.extend(batch.results)
-        cursor = batch.cursor
-        if not cursor:
-            break
-
-    trackers = sorted(trackers, key=lambda r: r.updated, reverse=True)
+def get_trackers(owner, project, search=None):
+    from hubsrht.services.todo import TodoClient
+    client = pooled(TodoClient, timeout=render_timeout)
+    trackers, more = list_remote(
+        lambda cursor: client.get_trackers(cursor).me.trackers,
+        search=search)
     existing = [t.remote_id for t in (Tracker.query
             .filter(Tracker.project_id == project.id)).all()]
-    return trackers, existing
+    return trackers, existing, more
 
 @trackers.route("/<owner>/<project_name>/trackers/new")
 @loginrequired
 def new_GET(owner, project_name):
     owner, project = get_project_or_redir(owner, project_name, ProjectAccess.write)
-    trackers, existing = get_trackers(owner, project)
+    trackers, existing, more = get_trackers(owner, project)
     return render_template("tracker-new.html", view="new-resource",
-            owner=owner, project=project, trackers=trackers, existing=existing)
+            owner=owner, project=project, trackers=trackers, existing=existing,
+            more=more)
 
 @trackers.route("/<owner>/<project_name>/trackers/new", methods=["POST"])
 @loginrequired
 def new_POST(owner, project_name):
+    from hubsrht.services.hub import HubClient
+    from hubsrht.services.todo import TodoClient
+    from hubsrht.services.todo import Visibility as TrackerVisibility
     owner, project = get_project(owner, project_name, ProjectAccess.write)
     if project is None:
         abort(404)
 
-    todo_client = TodoClient()
+    todo_client = pooled(TodoClient)
     valid = Validation(request)
     visibility = TrackerVisibility(project.visibility.value)
 
@@ -84,10 +80,11 @@ def new_POST(owner, project_name):
                     visibility=visibility,
             ).tracker
         if not valid.ok:
-            trackers, existing = get_trackers(owner, project)
+            trackers, existing, more = get_trackers(owner, project)
             return render_template("tracker-new.html",
                     view="new-resource", owner=owner, project=project,
-                    trackers=trackers, existing=existing, **valid.kwargs)
+                    trackers=trackers, existing=existing, more=more,
+                    **valid.kwargs)
     else:
         tracker_rid = None
         for field in valid.source:
@@ -97,15 +94,15 @@ def new_POST(owner, project_name):
 
         if not tracker_rid:
             search = valid.optional("search")
-            trackers, existing = get_trackers(owner, project)
-            trackers = filter(lambda r: search.lower() in r.name.lower(), trackers)
+            trackers, existing, more = get_trackers(owner, project, search)
             return render_template("tracker-new.html",
                     view="new-resource", owner=owner, project=project,
-                    trackers=trackers, existing=existing, **valid.kwargs)
+                    trackers=trackers, existing=existing, more=more,
+                    **valid.kwargs)
 
         remote_tracker = todo_client.get_tracker(tracker_rid).tracker
 
-    tracker = HubClient().link_tracker(to_rid(project.rid), remote_tracker.rid).tracker
+    tracker = pooled(HubClient).link_tracker(to_rid(project.rid), remote_tracker.rid).tracker
     if tracker is None:
         return
 
@@ -151,6 +148,8 @@ def delete_GET(owner, project_name, tracker_id):
         methods=["POST"])
 @loginrequired
 def delete_POST(owner, project_name, tracker_id):
+    from hubsrht.services.hub import HubClient
+    from hubsrht.services.todo import TodoClient
     owner, project = get_project(owner, project_name, ProjectAccess.write)
     if project is None:
         abort(404)
@@ -160,12 +159,12 @@ def delete_POST(owner, project_name, tracker_id):
     if not tracker:
         abort(404)
 
-    HubClient().unlink_tracker(to_rid(project.rid), tracker.remote_rid)
+    pooled(HubClient).unlink_tracker(to_rid(project.rid), tracker.remote_rid)
 
     valid = Validation(request)
     delete_remote = valid.optional("delete-remote") == "on"
     if delete_remote:
-        TodoClient().delete_tracker(tracker.remote_id)
+        pooled(TodoClient).delete_tracker(tracker.remote_id)
 
     return redirect(url_for("projects.summary_GET",
         owner=owner.canonical_name, project_name=project.name))
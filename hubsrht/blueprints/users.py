@@ -1,9 +1,8 @@
 from flask import Blueprint, render_template, request, abort
+from hubsrht.projects import search_projects
 from hubsrht.types import User, Project, Visibility
-from sqlalchemy.sql import operators
 from srht.app import paginate_query, get_profile
 from srht.oauth import current_user, UserType
-from srht.search import search_by
 
 users = Blueprint("users", __name__)
 
@@ -46,11 +45,7 @@ def projects_GET(owner):
     search_error = None
     if search:
         try:
-            projects = search_by(projects, search,
-                    [Project.name, Project.description],
-                    key_fns={"tag": lambda t:
-                        Project.tags.any(t, operator=operators.ilike_op)},
-                    term_map=lambda t: f"tag:{t[1:]}" if t.startswith("#") else t)
+            projects = search_projects(projects, search)
         except ValueError as e:
             search_error = str(e)
 
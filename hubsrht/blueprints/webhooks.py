@@ -2,25 +2,20 @@ import html
 import json
 import re
 from datetime import datetime
-from flask import Blueprint, request, current_app
-from hubsrht.builds import submit_patchset
-from hubsrht.services.hg import EventWebhook as HgEventWebhook
-from hubsrht.services.hg import WebhookEvent as HgWebhookEvent
-from hubsrht.services.todo import TodoClient, SubmitCommentInput
-from hubsrht.services.todo import TicketStatus, TicketResolution
-from hubsrht.services.todo import GraphQLClientGraphQLMultiError
-from hubsrht.services.todo import EventWebhook as TodoEventWebhook
-from hubsrht.services.todo import WebhookEvent as TodoWebhookEvent
-from hubsrht.services.todo import EventType as TodoEventType
-from hubsrht.services.git import EventWebhook as GitEventWebhook
-from hubsrht.services.git import WebhookEvent as GitWebhookEvent
-from hubsrht.services.lists import ListsClient, ToolIcon
-from hubsrht.services.lists import EventWebhook as ListEventWebhook
-from hubsrht.services.lists import WebhookEvent as ListWebhookEvent
+from flask import Blueprint, request
+from functools import cache
+from hubsrht import webhook_queue
+from hubsrht.builds import submit_patchset, invalidate_manifests
+from hubsrht.readme import invalidate_readme
+from hubsrht.touch import flush_touches, touch_project
 from hubsrht.trailers import commit_trailers
+from hubsrht.transport import pooled
 from hubsrht.types import Event, EventType, EventProjectAssociation
 from hubsrht.types import Tracker, MailingList, SourceRepo, RepoType
-from hubsrht.types import User, Visibility
+from hubsrht.types import TicketReference, User, Visibility
+from hubsrht.usercache import lookup_user
+from sqlalchemy import delete, update
+from sqlalchemy.dialects import postgresql
 from srht.app import csrf_bypass
 from srht.config import get_origin
 from srht.crypto import fernet, verify_request_signature
@@ -30,55 +25,79 @@ from urllib.parse import quote
 
 webhooks = Blueprint("webhooks", __name__)
 
+# The generated service clients are imported by the handlers which need them,
+# so that loading the app does not import all of them.
+
 _gitsrht = get_origin("git.sr.ht", external=True, default=None)
 _hgsrht = get_origin("hg.sr.ht", external=True, default=None)
 _todosrht = get_origin("todo.sr.ht", external=True, default=None)
 _listssrht = get_origin("lists.sr.ht", external=True, default=None)
 
-_ticket_url_re = re.compile(
-    rf"""
-    ^
-    {re.escape(_todosrht)}
-    /(?P<owner>~[a-z_][a-z0-9_-]+)
-    /(?P<tracker>[\w.-]+)
-    /(?P<ticket>\d+)
-    $
-    """,
-    re.VERBOSE,
-) if _todosrht else None
+@cache
+def _ticket_url_re():
+    return re.compile(
+        rf"""
+        ^
+        {re.escape(_todosrht)}
+        /(?P<owner>~[a-z_][a-z0-9_-]+)
+        /(?P<tracker>[\w.-]+)
+        /(?P<ticket>\d+)
+        $
+        """,
+        re.VERBOSE,
+    )
+
+def _ingest(handler, resource_key, **kwargs):
+    """
+    Verify an incoming webhook and either process it immediately or, if the
+    webhook queue is enabled, store it for contrib/webhook-worker.
+    """
+    payload = verify_request_signature(request)
+    if webhook_queue.enabled:
+        webhook_queue.enqueue(handler.__name__, resource_key, payload, kwargs)
+        return "Queued for processing", 202
+    result = handler(payload, **kwargs)
+    try:
+        flush_touches()
+    except Exception as ex:
+        # The webhook itself was processed; the touches are kept for later
+        print(f"Error flushing project touches: {ex}")
+    return result
 
 @csrf_bypass
 @webhooks.route("/webhooks/gql/git-user/<int:user_id>", methods=["POST"])
 def git_user(user_id):
-    payload = verify_request_signature(request)
+    return _ingest(_git_user, f"git-user:{user_id}", user_id=user_id)
+
+def _git_user(payload, user_id):
+    from hubsrht.services.git import EventWebhook, WebhookEvent
     payload = json.loads(payload.decode('utf-8'))["data"]
-    webhook = GitEventWebhook.model_validate(payload).webhook
+    webhook = EventWebhook.model_validate(payload).webhook
     repo = webhook.repository
 
     match webhook.event:
-        case GitWebhookEvent.REPO_DELETED:
-            source_repos = (SourceRepo.query
-                .filter(SourceRepo.repo_type == RepoType.git)
-                .filter(SourceRepo.remote_id == repo.id)
-            )
-            for source_repo in source_repos:
-                if source_repo.project.summary_repo_id == repo.id:
-                    source_repo.project_summary_repo = None
-                    db.session.commit()
-                db.session.delete(source_repo)
-                db.session.commit()
+        case WebhookEvent.REPO_DELETED:
+            # Projects using it as their summary repo are reset by the
+            # database (ON DELETE SET NULL), and its events are deleted
+            db.session.execute(delete(SourceRepo)
+                .where(SourceRepo.repo_type == RepoType.git)
+                .where(SourceRepo.remote_id == repo.id))
+            db.session.commit()
             return f"Deleted repository with remote ID {webhook.repository.id}"
-        case GitWebhookEvent.REPO_UPDATE:
-            source_repos = (SourceRepo.query
-                .filter(SourceRepo.repo_type == RepoType.git)
-                .filter(SourceRepo.remote_id == repo.id)
-            )
-            for source_repo in source_repos:
-                source_repo.name = repo.name
-                source_repo.description = repo.description
-                source_repo.visibility = Visibility(repo.visibility.value)
-                source_repo.project.updated = datetime.utcnow()
-                db.session.commit()
+        case WebhookEvent.REPO_UPDATE:
+            visibility = Visibility(repo.visibility.value)
+            updated = db.session.execute(update(SourceRepo)
+                .where(SourceRepo.repo_type == RepoType.git)
+                .where(SourceRepo.remote_id == repo.id)
+                .values(name=repo.name, description=repo.description,
+                    visibility=visibility)
+                .returning(SourceRepo.id, SourceRepo.project_id)).all()
+            _update_event_visibility(Event.source_repo_id,
+                    [row.id for row in updated], visibility)
+            db.session.commit()
+            for row in updated:
+                touch_project(row.project_id)
+            invalidate_readme(RepoType.git, repo.id)
             return f"Updated repository with remote ID {webhook.repository.id}"
 
     return "No action required"
@@ -86,58 +105,61 @@ def git_user(user_id):
 @csrf_bypass
 @webhooks.route("/webhooks/gql/git-repo/<int:repo_id>", methods=["POST"])
 def git_repo(repo_id):
-    payload = verify_request_signature(request)
+    return _ingest(_git_repo, f"git-repo:{repo_id}", repo_id=repo_id)
+
+def _git_repo(payload, repo_id):
+    from hubsrht.services.git import EventWebhook, WebhookEvent
     payload = json.loads(payload.decode('utf-8'))["data"]
-    webhook = GitEventWebhook.model_validate(payload).webhook
+    webhook = EventWebhook.model_validate(payload).webhook
     repo = SourceRepo.query.get(repo_id)
     if not repo:
         return "No action required; unknown repository"
-    if webhook.event != GitWebhookEvent.GIT_POST_RECEIVE:
+    if webhook.event != WebhookEvent.GIT_POST_RECEIVE:
         return "No action required; unknown event"
 
+    invalidate_readme(repo.repo_type, repo.remote_id)
+    invalidate_manifests(repo)
+
     repo_name = repo.owner.canonical_name + "/" + repo.name
     pusher_name = webhook.pusher.canonical_name
     pusher_url = f"{_gitsrht}/{pusher_name}"
-    pusher = current_app.oauth_service.lookup_user(webhook.pusher.username)
+    pusher = lookup_user(webhook.pusher.username)
 
-    for update in webhook.updates:
-        if not update.new:
+    # Several refs may point to the same commit; only record it once.
+    commits = dict()
+    for ref_update in webhook.updates:
+        if not ref_update.new:
             continue
-
-        commit_sha = update.new.short_id
+        commit_sha = ref_update.new.short_id
         commit_url = repo.url() + f"/commit/{commit_sha}"
-        commit_message = update.new.message.split("\n")[0]
-
-        event = Event()
-        event.id = _dedupe_event("git.sr.ht", pusher, repo, commit_url)
-        if event.id is None:
-            # This is a brand new event.
-            event.event_type = EventType.external_event
-            event.source_repo_id = repo.id
-            event.user_id = pusher.id
-
-            event.external_source = "git.sr.ht"
-            event.external_summary = (
+        commits.setdefault(commit_url, ref_update.new)
+
+    events = []
+    for commit_url, commit in commits.items():
+        commit_sha = commit.short_id
+        commit_message = commit.message.split("\n")[0]
+        events.append({
+            "source_repo_id": repo.id,
+            "user_id": pusher.id,
+            "external_source": "git.sr.ht",
+            "external_summary": (
                 f"<a href='{commit_url}'>{commit_sha}</a> " +
-                f"<code>{html.escape(commit_message)}</code>")
-            event.external_summary_plain = f"{commit_sha} - {commit_message}"
-            event.external_details = (
+                f"<code>{html.escape(commit_message)}</code>"),
+            "external_summary_plain": f"{commit_sha} - {commit_message}",
+            "external_details": (
                 f"<a href='{pusher_url}'>{pusher_name}</a> pushed to " +
-                f"<a href='{repo.url()}'>{repo_name}</a> git")
-            event.external_details_plain = f"{pusher_name} pushed to {repo_name} git"
-            event.external_url = commit_url
-            repo.project.updated = datetime.utcnow()
-            db.session.add(event)
-            db.session.flush()
-
-            # That needs associating to the project.
-            assoc = EventProjectAssociation()
-            assoc.event_id = event.id
-            assoc.project_id = repo.project_id
-            db.session.add(assoc)
+                f"<a href='{repo.url()}'>{repo_name}</a> git"),
+            "external_details_plain": f"{pusher_name} pushed to {repo_name} git",
+            "external_url": commit_url,
+        })
+
+    _, new_ids = _add_external_events(repo, events)
+    if new_ids:
+        touch_project(repo.project_id)
 
     db.session.commit()
 
+    commits = []
     for upd in webhook.updates:
         if not upd.old or not upd.new:
             continue # New ref, or ref deleted
@@ -145,44 +167,45 @@ def git_repo(repo_id):
         if not upd.log or not upd.log.results or not any(upd.log.results):
             continue
 
-        for commit in reversed(upd.log.results):
-            for trailer, value in commit_trailers(commit.message):
-                _handle_commit_trailer(trailer, value, pusher, repo, commit)
+        commits.extend(reversed(upd.log.results))
+    _handle_commit_trailers(pusher, repo, commits)
 
     return f"Processed push event for local repo ID {repo.id}"
 
 @csrf_bypass
 @webhooks.route("/webhooks/gql/hg-user/<int:user_id>", methods=["POST"])
 def hg_user(user_id):
-    payload = verify_request_signature(request)
+    return _ingest(_hg_user, f"hg-user:{user_id}", user_id=user_id)
+
+def _hg_user(payload, user_id):
+    from hubsrht.services.hg import EventWebhook, WebhookEvent
     payload = json.loads(payload.decode('utf-8'))["data"]
-    webhook = HgEventWebhook.model_validate(payload).webhook
+    webhook = EventWebhook.model_validate(payload).webhook
     repo = webhook.repository
 
     match webhook.event:
-        case HgWebhookEvent.REPO_DELETED:
-            source_repos = (SourceRepo.query
-                .filter(SourceRepo.repo_type == RepoType.hg)
-                .filter(SourceRepo.remote_id == repo.id)
-            )
-            for source_repo in source_repos:
-                if source_repo.project.summary_repo_id == repo.id:
-                    source_repo.project_summary_repo = None
-                    db.session.commit()
-                db.session.delete(source_repo)
-                db.session.commit()
+        case WebhookEvent.REPO_DELETED:
+            # Projects using it as their summary repo are reset by the
+            # database (ON DELETE SET NULL), and its events are deleted
+            db.session.execute(delete(SourceRepo)
+                .where(SourceRepo.repo_type == RepoType.hg)
+                .where(SourceRepo.remote_id == repo.id))
+            db.session.commit()
             return f"Deleted repository with remote ID {webhook.repository.id}"
-        case HgWebhookEvent.REPO_UPDATE:
-            source_repos = (SourceRepo.query
-                .filter(SourceRepo.repo_type == RepoType.hg)
-                .filter(SourceRepo.remote_id == repo.id)
-            )
-            for source_repo in source_repos:
-                source_repo.name = repo.name
-                source_repo.description = repo.description
-                source_repo.visibility = Visibility(repo.visibility.value)
-                source_repo.project.updated = datetime.utcnow()
-                db.session.commit()
+        case WebhookEvent.REPO_UPDATE:
+            visibility = Visibility(repo.visibility.value)
+            updated = db.session.execute(update(SourceRepo)
+                .where(SourceRepo.repo_type == RepoType.hg)
+                .where(SourceRepo.remote_id == repo.id)
+                .values(name=repo.name, description=repo.description,
+                    visibility=visibility)
+                .returning(SourceRepo.id, SourceRepo.project_id)).all()
+            _update_event_visibility(Event.source_repo_id,
+                    [row.id for row in updated], visibility)
+            db.session.commit()
+            for row in updated:
+                touch_project(row.project_id)
+            invalidate_readme(RepoType.hg, repo.id)
             return f"Updated repository with remote ID {webhook.repository.id}"
 
     return "No action required"
@@ -190,27 +213,31 @@ def hg_user(user_id):
 @csrf_bypass
 @webhooks.route("/webhooks/gql/mailing-list-user/<int:user_id>", methods=["POST"])
 def mailing_list_user(user_id):
-    payload = verify_request_signature(request)
+    return _ingest(_mailing_list_user, f"mailing-list-user:{user_id}",
+            user_id=user_id)
+
+def _mailing_list_user(payload, user_id):
+    from hubsrht.services.lists import EventWebhook, WebhookEvent
     payload = json.loads(payload.decode('utf-8'))["data"]
-    webhook = ListEventWebhook.model_validate(payload).webhook
+    webhook = EventWebhook.model_validate(payload).webhook
     mlist = webhook.mailing_list
 
     match webhook.event:
-        case ListWebhookEvent.LIST_DELETED:
-            mailing_lists = (MailingList.query
-                .filter(MailingList.remote_id == mlist.id))
-            for mailing_list in mailing_lists:
-                db.session.delete(mailing_list)
-                db.session.commit()
+        case WebhookEvent.LIST_DELETED:
+            db.session.execute(delete(MailingList)
+                .where(MailingList.remote_id == mlist.id))
+            db.session.commit()
             return f"Deleted mailing list with remote ID {mlist.id}"
-        case ListWebhookEvent.LIST_UPDATED:
-            mailing_lists = (MailingList.query
-                .filter(MailingList.remote_id == webhook.mailing_list.id))
-            for mailing_list in mailing_lists:
-                mailing_list.name = mlist.name
-                mailing_list.description = mlist.description
-                mailing_list.visibility = Visibility(mlist.visibility.value)
-                db.session.commit()
+        case WebhookEvent.LIST_UPDATED:
+            visibility = Visibility(mlist.visibility.value)
+            updated = db.session.execute(update(MailingList)
+                .where(MailingList.remote_id == mlist.id)
+                .values(name=mlist.name, description=mlist.description,
+                    visibility=visibility)
+                .returning(MailingList.id)).all()
+            _update_event_visibility(Event.mailing_list_id,
+                    [row.id for row in updated], visibility)
+            db.session.commit()
             return f"Updated mailing list with remote ID {mlist.id}"
 
     return "No action required"
@@ -218,10 +245,13 @@ def mailing_list_user(user_id):
 @csrf_bypass
 @webhooks.route("/webhooks/gql/mailing-list/<int:list_id>", methods=["POST"])
 def project_mailing_list(list_id):
-    event = request.headers.get("X-Webhook-Event")
-    payload = verify_request_signature(request)
+    return _ingest(_project_mailing_list, f"mailing-list:{list_id}",
+            list_id=list_id)
+
+def _project_mailing_list(payload, list_id):
+    from hubsrht.services.lists import EventWebhook, WebhookEvent
     payload = json.loads(payload.decode('utf-8'))["data"]
-    webhook = ListEventWebhook.model_validate(payload).webhook
+    webhook = EventWebhook.model_validate(payload).webhook
 
     mailing_list = (MailingList.query
              .filter(MailingList.id == list_id)).one_or_none()
@@ -229,7 +259,7 @@ def project_mailing_list(list_id):
         return "I don't recognize that mailing list.", 404
 
     match webhook.event:
-        case ListWebhookEvent.EMAIL_RECEIVED:
+        case WebhookEvent.EMAIL_RECEIVED:
             email = webhook.email
             sender_canon = email.sender.canonical_name
             if hasattr(email.sender, "username"):
@@ -241,42 +271,30 @@ def project_mailing_list(list_id):
             message_id = f"<{email.message_id}>"
             archive_url = f"{mailing_list.url()}/{quote(message_id)}"
 
-            event = Event()
             if sender_username:
-                sender = current_app.oauth_service.lookup_user(sender_username)
-                event.user_id = sender.id
+                sender = lookup_user(sender_username)
                 attrib = f"<a href='{_listssrht}/{sender_canon}'>{sender_canon}</a>"
             else:
                 attrib = sender_canon
                 sender = None
 
-            event.id = _dedupe_event("lists.sr.ht", sender, mailing_list, archive_url)
-            if event.id is None:
-                # This is a brand new event.
-                event.event_type = EventType.external_event
-                event.mailing_list_id = mailing_list.id
-                event.external_source = "lists.sr.ht"
-                event.external_summary = f"<a href='{archive_url}'>{html.escape(subject)}</a>"
-                event.external_details = (f"{attrib} via " +
-                        f"<a href='{mailing_list.url()}'>{mailing_list.name}</a>")
-                event.external_url = archive_url
-                db.session.add(event)
-                db.session.flush()
-
-                # That needs associating to the project.
-                assoc = EventProjectAssociation()
-                assoc.event_id = event.id
-                assoc.project_id = mailing_list.project_id
-                db.session.add(assoc)
-
+            [event_id], _ = _add_external_events(mailing_list, [{
+                "mailing_list_id": mailing_list.id,
+                "user_id": sender.id if sender else None,
+                "external_source": "lists.sr.ht",
+                "external_summary": f"<a href='{archive_url}'>{html.escape(subject)}</a>",
+                "external_details": (f"{attrib} via " +
+                        f"<a href='{mailing_list.url()}'>{mailing_list.name}</a>"),
+                "external_url": archive_url,
+            }])
             db.session.commit()
-            return f"Assigned event ID {event.id}"
-        case ListWebhookEvent.PATCHSET_RECEIVED:
+            return f"Assigned event ID {event_id}"
+        case WebhookEvent.PATCHSET_RECEIVED:
             patchset = webhook.patchset
 
             sender = None
             if hasattr(patchset.submitter, "username"):
-                sender = current_app.oauth_service.lookup_user(patchset.submitter.username)
+                sender = lookup_user(patchset.submitter.username)
 
             for email in patchset.patches.results:
                 if email.patch.trailers:
@@ -298,27 +316,35 @@ def project_mailing_list(list_id):
 @csrf_bypass
 @webhooks.route("/webhooks/gql/todo-user/<int:user_id>", methods=["POST"])
 def todo_user(user_id):
-    payload = verify_request_signature(request)
+    return _ingest(_todo_user, f"todo-user:{user_id}", user_id=user_id)
+
+def _todo_user(payload, user_id):
+    from hubsrht.services.todo import EventWebhook, WebhookEvent
     payload = json.loads(payload.decode('utf-8'))["data"]
-    webhook = TodoEventWebhook.model_validate(payload).webhook
+    webhook = EventWebhook.model_validate(payload).webhook
     tracker = webhook.tracker
 
     match webhook.event:
-        case TodoWebhookEvent.TRACKER_DELETED:
-            trackers = Tracker.query.filter(Tracker.remote_id == tracker.id)
-            for tr in trackers:
-                tr.project.updated = datetime.utcnow()
-                db.session.delete(tr)
+        case WebhookEvent.TRACKER_DELETED:
+            deleted = db.session.execute(delete(Tracker)
+                .where(Tracker.remote_id == tracker.id)
+                .returning(Tracker.project_id)).all()
             db.session.commit()
+            for row in deleted:
+                touch_project(row.project_id)
             return f"Deleted local trackers corresponding to remote ID {tracker.id}"
-        case TodoWebhookEvent.TRACKER_UPDATE:
-            trackers = Tracker.query.filter(Tracker.remote_id == tracker.id)
-            for tr in trackers:
-                tr.name = tracker.name
-                tr.description = tracker.description
-                tr.visibility = Visibility(tracker.visibility.value)
-                tr.project.updated = datetime.utcnow()
+        case WebhookEvent.TRACKER_UPDATE:
+            visibility = Visibility(tracker.visibility.value)
+            updated = db.session.execute(update(Tracker)
+                .where(Tracker.remote_id == tracker.id)
+                .values(name=tracker.name, description=tracker.description,
+                    visibility=visibility)
+                .returning(Tracker.id, Tracker.project_id)).all()
+            _update_event_visibility(Event.tracker_id,
+                    [row.id for row in updated], visibility)
             db.session.commit()
+            for row in updated:
+                touch_project(row.project_id)
             return f"Updated local trackers corresponding to remote ID {tracker.id}"
 
     return "No action required"
@@ -326,22 +352,24 @@ def todo_user(user_id):
 @csrf_bypass
 @webhooks.route("/webhooks/gql/todo-tracker/<int:tracker_id>", methods=["POST"])
 def todo_tracker(tracker_id):
-    payload = verify_request_signature(request)
+    return _ingest(_todo_tracker, f"todo-tracker:{tracker_id}",
+            tracker_id=tracker_id)
+
+def _todo_tracker(payload, tracker_id):
+    from hubsrht.services.todo import EventWebhook, WebhookEvent
+    from hubsrht.services.todo import EventType as TodoEventType
     payload = json.loads(payload.decode('utf-8'))["data"]
-    webhook = TodoEventWebhook.model_validate(payload).webhook
+    webhook = EventWebhook.model_validate(payload).webhook
 
     tracker = Tracker.query.get(tracker_id)
     if not tracker:
         return "Unknown tracker", 404
 
-    event = Event()
-    event.event_type = EventType.external_event
-    event.tracker_id = tracker.id
-
+    user_id = None
     match webhook.event:
-        case TodoWebhookEvent.TICKET_CREATED:
+        case WebhookEvent.TICKET_CREATED:
             submitter = webhook.ticket.submitter
-        case TodoWebhookEvent.EVENT_CREATED:
+        case WebhookEvent.EVENT_CREATED:
             comments = [
                 ch for ch in webhook.new_event.changes
                 if ch.event_type == TodoEventType.COMMENT
@@ -351,11 +379,12 @@ def todo_tracker(tracker_id):
             assert len(comments) == 1
             comment = comments[0]
             submitter = comment.author
+        case _:
+            return "No action required"
 
     match submitter.typename__:
         case "User":
-            event.user_id = (current_app.oauth_service
-                .lookup_user(submitter.username).id)
+            user_id = lookup_user(submitter.username).id
             canonical_name = submitter.canonical_name
             submitter_url = f"{_todosrht}/{canonical_name}"
             submitter_url = f"<a href='{submitter_url}'>{canonical_name}</a>"
@@ -374,62 +403,53 @@ def todo_tracker(tracker_id):
             else:
                 submitter_url = f"{external_id}"
 
+    # Each ticket and comment has its own URL, so that the event is only
+    # recorded once if this delivery is processed again
     match webhook.event:
-        case TodoWebhookEvent.TICKET_CREATED:
+        case WebhookEvent.TICKET_CREATED:
             ticket = webhook.ticket
             ticket_url = tracker.url() + f"/{ticket.id}"
-            event.external_source = "todo.sr.ht"
-            event.external_summary = (
-                f"<a href='{ticket_url}'>#{ticket.id}</a> " +
-                f"{html.escape(ticket.subject)}")
-            event.external_summary_plain = f"#{ticket.id} {ticket.subject}"
-            event.external_details = (
-                f"{submitter_url} filed ticket on " +
-                f"<a href='{tracker.url()}'>{tracker.name}</a> todo")
-            event.external_details_plain = f"{submitter.canonical_name} filed ticket on {tracker.name} todo"
-            event.external_url = ticket_url
-
-            db.session.add(event)
-            db.session.flush()
-
-            assoc = EventProjectAssociation()
-            assoc.event_id = event.id
-            assoc.project_id = tracker.project_id
-            db.session.add(assoc)
-            db.session.commit()
-
-            return "Processed new ticket"
-        case TodoWebhookEvent.EVENT_CREATED:
+            event_url = ticket_url
+            action = "filed ticket on"
+            result = "Processed new ticket"
+        case WebhookEvent.EVENT_CREATED:
             ticket = webhook.new_event.ticket
             ticket_url = tracker.url() + f"/{ticket.id}"
-
-            event.external_source = "todo.sr.ht"
-            event.external_summary = (
-                f"<a href='{ticket_url}'>#{ticket.id}</a> " +
-                f"{html.escape(ticket.subject)}")
-            event.external_summary_plain = f"#{ticket.id} {ticket.subject}"
-            event.external_details = (
-                f"{submitter_url} commented on " +
-                f"<a href='{tracker.url()}'>{tracker.name}</a> todo")
-
-            event.external_details_plain = f"{submitter.canonical_name} commented on {tracker.name} todo"
-            event.external_url = ticket_url
-
-            db.session.add(event)
-            db.session.flush()
-
-            assoc = EventProjectAssociation()
-            assoc.event_id = event.id
-            assoc.project_id = tracker.project_id
-            db.session.add(assoc)
-            db.session.commit()
-            return "Processed new comment"
-
-    return "No action required"
+            event_url = ticket_url + f"#event-{webhook.new_event.id}"
+            action = "commented on"
+            result = "Processed new comment"
+
+    _add_external_events(tracker, [{
+        "tracker_id": tracker.id,
+        "user_id": user_id,
+        "external_source": "todo.sr.ht",
+        "external_summary": (f"<a href='{ticket_url}'>#{ticket.id}</a> " +
+                f"{html.escape(ticket.subject)}"),
+        "external_summary_plain": f"#{ticket.id} {ticket.subject}",
+        "external_details": (f"{submitter_url} {action} " +
+                f"<a href='{tracker.url()}'>{tracker.name}</a> todo"),
+        "external_details_plain": f"{submitter.canonical_name} {action} {tracker.name} todo",
+        "external_url": event_url,
+    }])
+    db.session.commit()
+    return result
+
+# Handlers which may be invoked by contrib/webhook-worker for queued deliveries.
+# They may run more than once for the same delivery, see webhook_queue.
+handlers = {h.__name__: h for h in [
+    _git_user,
+    _git_repo,
+    _hg_user,
+    _mailing_list_user,
+    _project_mailing_list,
+    _todo_user,
+    _todo_tracker,
+]}
 
 @csrf_bypass
 @webhooks.route("/webhooks/build-complete/<details>", methods=["POST"])
 def build_complete(details):
+    from hubsrht.services.lists import ListsClient, ToolIcon
     payload = verify_request_signature(request)
     payload = json.loads(payload.decode('utf-8'))
     details = fernet.decrypt(details.encode())
@@ -447,7 +467,7 @@ def build_complete(details):
     builds_origin = get_origin("builds.sr.ht", external=True)
     build_url = f"{builds_origin}/{project.owner.canonical_name}/job/{payload['id']}"
 
-    lists_client = ListsClient(InternalAuth(project.owner))
+    lists_client = pooled(ListsClient, InternalAuth(project.owner))
     # TODO: Update me once builds.sr.ht adds a native enum for this
     match payload["status"]:
         case 'pending':
@@ -467,60 +487,145 @@ def build_complete(details):
 
     return "Thanks!"
 
-# If we already have an event from source and sender on resource for the same
-# event_key (this can happen for lists/repositories/trackers shared by several
-# projects), add a new mapping in the event/project association table and
-# return the ID of the event deduped into; otherwise return None.
-def _dedupe_event(source, sender, resource, event_key):
-    q = (Event.query
-        .filter(Event.event_type == EventType.external_event)
-        .filter(Event.external_source == source)
-        .filter(Event.external_url == event_key))
-    if sender:
-        q = q.filter(Event.user_id == sender.id)
-
-    existing_evt = q.one_or_none()
-
-    if existing_evt:
-        assoc = EventProjectAssociation()
-        assoc.event_id = existing_evt.id
-        assoc.project_id = resource.project_id
-        db.session.add(assoc)
-        return existing_evt.id
-
-    return None
-
-def _handle_commit_trailer(trailer, value, pusher, repo, commit):
+# Insert external events on behalf of a resource, and associate them with the
+# resource's project. If we already have an event from the same source and
+# sender for the same URL (this can happen for lists/repositories/trackers
+# shared by several projects), the existing event is associated instead; the
+# unique index on event.dedupe_key makes this safe against concurrent
+# deliveries. Returns the list of event IDs, in order, and the set of IDs of
+# the events which were newly created.
+def _add_external_events(resource, events):
+    if not events:
+        return [], set()
+
+    now = datetime.utcnow()
+    rows = []
+    for event in events:
+        rows.append(dict(event,
+            created=now,
+            event_type=EventType.external_event,
+            visibility=resource.visibility,
+            dedupe_key=Event.dedupe_key_for(event["external_source"],
+                event["user_id"], event["external_url"]),
+        ))
+
+    table = Event.__table__
+    stmt = (postgresql.insert(table)
+        .values(rows)
+        .on_conflict_do_nothing(
+            index_elements=[table.c.dedupe_key],
+            index_where=table.c.dedupe_key.isnot(None))
+        .returning(table.c.id, table.c.dedupe_key))
+    event_ids = {bytes(key): id for id, key in db.session.execute(stmt)}
+    new_ids = set(event_ids.values())
+
+    missing = [r["dedupe_key"] for r in rows if r["dedupe_key"] not in event_ids]
+    if missing:
+        existing = (db.session.query(Event.id, Event.dedupe_key)
+            .filter(Event.dedupe_key.in_(missing)))
+        event_ids.update({bytes(key): id for id, key in existing})
+
+    event_ids = [event_ids[r["dedupe_key"]] for r in rows]
+    db.session.execute(postgresql.insert(EventProjectAssociation.__table__)
+            .values([{
+                "event_id": event_id,
+                "project_id": resource.project_id,
+            } for event_id in dict.fromkeys(event_ids)])
+            .on_conflict_do_nothing())
+    return event_ids, new_ids
+
+# Events carry a copy of their resource's visibility so that public feeds
+# need not join every resource table; keep it in sync when that changes.
+def _update_event_visibility(column, resource_ids, visibility):
+    if not resource_ids:
+        return
+    (Event.query
+        .filter(column.in_(resource_ids))
+        .update({Event.visibility: visibility}, synchronize_session=False))
+
+# Trailer -> name of the TicketResolution it applies
+_trailer_resolutions = {
+    "Closes": "CLOSED",
+    "Fixes": "FIXED",
+    "Implements": "IMPLEMENTED",
+    "References": None,
+}
+
+def _handle_commit_trailers(pusher, repo, commits):
+    """
+    Cross-references the tickets mentioned in the trailers of the commits of a
+    push, in push order. Each ticket receives at most one comment (and status
+    change) for the whole push.
+    """
     if not _todosrht:
         return
 
-    if trailer == "Closes":
-        resolution = TicketResolution.CLOSED
-    elif trailer == "Fixes":
-        resolution = TicketResolution.FIXED
-    elif trailer == "Implements":
-        resolution = TicketResolution.IMPLEMENTED
-    elif trailer == "References":
-        resolution = None
-    else:
-        return
+    # ticket key -> (URL match, {commit ID: (commit, resolution)})
+    tickets = dict()
+    for commit in commits:
+        for trailer, value in commit_trailers(commit.message):
+            if trailer not in _trailer_resolutions:
+                continue
+            match = _ticket_url_re().match(value.strip())
+            if not match:
+                continue
+            _, refs = tickets.setdefault(_ticket_key(match), (match, dict()))
+            resolution = _trailer_resolutions[trailer]
+            if commit.id in refs and resolution is None:
+                resolution = refs[commit.id][1]
+            refs[commit.id] = (commit, resolution)
 
-    match = _ticket_url_re.match(value.strip())
-    if not match:
+    if not tickets:
         return
 
-    commit_message = html.escape(commit.message.split("\n")[0])
-    commit_author = html.escape(commit.author.name.strip())
-    commit_sha = commit.id[:7]
-    commit_url = repo.url() + f"/commit/{commit_sha}"
-    comment = f"""\
-*{commit_author} referenced this ticket in commit [{commit_sha}] on [{repo.name}]({repo.url()}).*
+    from hubsrht.services.todo import TodoClient
+    todo_client = pooled(TodoClient, InternalAuth(pusher))
+    for ticket_key, (match, refs) in tickets.items():
+        _reference_commits(todo_client, repo, ticket_key, match,
+                list(refs.values()))
+
+def _commit_comment(repo, commits):
+    links = []
+    for commit in commits:
+        commit_message = html.escape(commit.message.split("\n")[0])
+        commit_sha = commit.id[:7]
+        commit_url = repo.url() + f"/commit/{commit_sha}"
+        links.append(f"[{commit_sha}]: {commit_url} \"{commit_message}\"")
 
-[{commit_sha}]: {commit_url} "{commit_message}"\
+    if len(commits) == 1:
+        [commit] = commits
+        commit_author = html.escape(commit.author.name.strip())
+        return f"""\
+*{commit_author} referenced this ticket in commit [{commit.id[:7]}] on [{repo.name}]({repo.url()}).*
+
+{links[0]}\
 """
 
-    auth = InternalAuth(pusher)
-    todo_client = TodoClient(auth)
+    items = "\n".join(
+        f"- [{c.id[:7]}] by {html.escape(c.author.name.strip())}"
+        for c in commits)
+    links = "\n".join(links)
+    return f"""\
+*This ticket was referenced in {len(commits)} commits on [{repo.name}]({repo.url()}):*
+
+{items}
+
+{links}\
+"""
+
+def _reference_commits(todo_client, repo, ticket_key, match, refs):
+    from hubsrht.services.todo import SubmitCommentInput, TicketStatus
+    from hubsrht.services.todo import TicketResolution
+    from hubsrht.services.todo import GraphQLClientGraphQLMultiError
+    known = {reference for reference, in (db.session
+        .query(TicketReference.reference)
+        .filter(TicketReference.ticket == ticket_key)
+        .filter(TicketReference.reference.in_(
+            [f"commit:{commit.id}" for commit, _ in refs])))}
+    refs = [(commit, resolution) for commit, resolution in refs
+        if f"commit:{commit.id}" not in known]
+    if not refs:
+        return
 
     tracker = todo_client.get_ticket_comments(
             username=match["owner"][1:],
@@ -528,14 +633,28 @@ def _handle_commit_trailer(trailer, value, pusher, repo, commit):
             ticket_id=int(match["ticket"])
     ).user.tracker
     ticket = tracker.ticket
-    if not ticket or _ticket_has_comment(ticket, comment):
+    if not ticket:
+        return
+
+    # Skip commits which were referenced before the ledger knew about them
+    pending = []
+    for commit, resolution in refs:
+        if _ticket_has_comment(ticket, _commit_comment(repo, [commit])):
+            _record_reference(ticket_key, f"commit:{commit.id}")
+        else:
+            pending.append((commit, resolution))
+    if not pending:
         return
 
+    comment = _commit_comment(repo, [commit for commit, _ in pending])
+    resolutions = [r for _, r in pending if r is not None]
+    resolution = resolutions[-1] if resolutions else None
+
     try:
         comment_input = SubmitCommentInput(text=comment)
         if resolution is not None:
             comment_input.status = TicketStatus.RESOLVED
-            comment_input.resolution = resolution
+            comment_input.resolution = TicketResolution[resolution]
 
         todo_client.submit_comment(
                 tracker_id=tracker.id,
@@ -554,14 +673,22 @@ def _handle_commit_trailer(trailer, value, pusher, repo, commit):
                     comment=SubmitCommentInput(text=comment),
             )
         except GraphQLClientGraphQLMultiError as err:
-            if not has_error(Error.ACCESS_DENIED):
-                # Silently discard further access denied errors
+            if not has_error(err, Error.ACCESS_DENIED):
                 raise
+            # Silently discard further access denied errors. Nothing was
+            # posted, so leave the ledger alone: a later push by someone with
+            # access should still reference these commits.
+            return
+
+    for commit, _ in pending:
+        _record_reference(ticket_key, f"commit:{commit.id}")
 
 def _handle_patch_trailers(sender, mailing_list, email):
     if not _todosrht:
         return
 
+    from hubsrht.services.todo import TodoClient, SubmitCommentInput
+
     subject = email.subject
     message_id = f"<{email.message_id}>"
     archive_url = f"{mailing_list.url()}/patches/{email.patchset.id}#{quote(message_id)}"
@@ -575,12 +702,17 @@ def _handle_patch_trailers(sender, mailing_list, email):
     for trailer in email.patch.trailers:
         match trailer.name:
             case "References" | "Implements" | "Fixes" | "Closes":
-                match = _ticket_url_re.match(trailer.value.strip())
+                match = _ticket_url_re().match(trailer.value.strip())
                 if not match:
                     return
 
+                ticket_key = _ticket_key(match)
+                reference = f"patch:{email.patchset.id}:{email.message_id}"
+                if _has_reference(ticket_key, reference):
+                    continue
+
                 auth = InternalAuth(sender or mailing_list.owner)
-                todo_client = TodoClient(auth)
+                todo_client = pooled(TodoClient, auth)
 
                 comment = f"""\
 *{sender_name} referenced this ticket in a patch:*
@@ -595,6 +727,7 @@ def _handle_patch_trailers(sender, mailing_list, email):
                 ).user.tracker
                 ticket = tracker.ticket
                 if _ticket_has_comment(ticket, comment):
+                    _record_reference(ticket_key, reference)
                     continue
 
                 todo_client.submit_comment(
@@ -602,6 +735,26 @@ def _handle_patch_trailers(sender, mailing_list, email):
                         ticket_id=ticket.id,
                         comment=SubmitCommentInput(text=comment),
                 )
+                _record_reference(ticket_key, reference)
+
+def _ticket_key(match):
+    return f"{match['owner']}/{match['tracker']}/{match['ticket']}"
+
+# The ticket_reference ledger records the commits and patches which have
+# already been cross-referenced on a ticket, so that we only need to fetch the
+# ticket's comments from todo.sr.ht for references we have not seen before.
+def _has_reference(ticket_key, reference):
+    return db.session.query(TicketReference.query
+        .filter(TicketReference.ticket == ticket_key)
+        .filter(TicketReference.reference == reference)
+        .exists()).scalar()
+
+def _record_reference(ticket_key, reference):
+    db.session.execute(postgresql.insert(TicketReference.__table__)
+        .values(created=datetime.utcnow(),
+            ticket=ticket_key, reference=reference)
+        .on_conflict_do_nothing())
+    db.session.commit()
 
 def _ticket_has_comment(ticket, comment):
     for event in ticket.events.results:
@@ -1,49 +1,118 @@
+import copy
 import email.utils
 import json
 import random
 import re
-import yaml
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from flask import url_for
 from fnmatch import fnmatch
-from hubsrht.services.builds import BuildsClient, GraphQLClientGraphQLMultiError
-from hubsrht.services.builds import TriggerCondition, Visibility
-from hubsrht.services.builds import TriggerInput, EmailTriggerInput, TriggerType
-from hubsrht.services.git import GitClient
-from hubsrht.services.lists import ListsClient, ToolIcon
-from hubsrht.types import SourceRepo, RepoType
+from functools import cache, lru_cache
+from hubsrht.remote import in_context
+from hubsrht.transport import pooled
+from hubsrht.types import SourceRepo, RepoType, User
 from shlex import quote
 from sqlalchemy import func
 from srht.config import get_origin
 from srht.crypto import fernet
+from srht.database import db
 from srht.graphql import InternalAuth
-from yaml.error import YAMLError
+from srht.redis import redis
 
 _listssrht = get_origin("lists.sr.ht", external=True, default=None)
 
-_patchset_url_re = re.compile(
-    rf"""
-    ^
-    {re.escape(_listssrht)}
-    /(?P<owner>~[a-z_][a-z0-9_-]+)
-    /(?P<list>[\w.-]+)
-    /patches
-    /(?P<patchset_id>\d+)
-    $
-    """,
-    re.VERBOSE,
-) if _listssrht else None
+# Maximum number of manifests submitted to builds.sr.ht concurrently
+MAX_CONCURRENT_SUBMISSIONS = 4
+
+# Upper bound on how long cached build manifests are kept, should the push
+# webhook which invalidates them be missed. Builds are only submitted for git
+# repositories, which send one.
+MANIFEST_CACHE_TTL = timedelta(hours=1)
+
+# yaml and the generated service clients are only needed to submit builds, and
+# are imported by submit_patchset, so that webhooks which merely invalidate the
+# manifest cache do not load them.
+
+@cache
+def _patchset_url_re():
+    return re.compile(
+        rf"""
+        ^
+        {re.escape(_listssrht)}
+        /(?P<owner>~[a-z_][a-z0-9_-]+)
+        /(?P<list>[\w.-]+)
+        /patches
+        /(?P<patchset_id>\d+)
+        $
+        """,
+        re.VERBOSE,
+    )
+
+def _manifest_cache_key(repo):
+    return f"hub.sr.ht:manifests:{repo.remote_id}"
+
+def get_manifests(git_client, repo):
+    """
+    Returns the build manifests of a git repository as a dict of file names to
+    YAML text, or None if the repository has no manifests. Results are cached
+    until the repository is pushed to.
+    """
+    key = _manifest_cache_key(repo)
+    cached = redis.get(key)
+    if cached is not None:
+        return json.loads(cached)
+
+    git_repo = git_client.get_manifests(repo.owner.username, repo.name).user.repository
+    assert git_repo is not None
+
+    manifests = dict()
+    if git_repo.multiple:
+        for dirent in git_repo.multiple.object.entries.results:
+            if not dirent.object:
+                continue
+            if not any(fnmatch(dirent.name, pat) for pat in ["*.yml", "*.yaml"]):
+                continue
+            manifests[dirent.name] = dirent.object.text
+    elif git_repo.single_yml:
+        manifests[".build.yml"] = git_repo.single_yml.object.text
+    elif git_repo.single_yaml:
+        manifests[".build.yaml"] = git_repo.single_yaml.object.text
+    else:
+        manifests = None
+
+    redis.setex(key, MANIFEST_CACHE_TTL, json.dumps(manifests))
+    return manifests
+
+def invalidate_manifests(repo):
+    """Forces the manifests of this repository to be fetched again."""
+    redis.delete(_manifest_cache_key(repo))
+
+@lru_cache(maxsize=256)
+def _parse_manifest(text):
+    # Callers must copy the result before modifying it
+    import yaml
+    return yaml.safe_load(text)
 
 def submit_patchset(ml, patchset):
     buildsrht = get_origin("builds.sr.ht", external=True, default=None)
     if not buildsrht:
         return None
+    import yaml
     from buildsrht.manifest import Manifest, Task, Trigger
+    from hubsrht.services.builds import BuildsClient
+    from hubsrht.services.builds import GraphQLClientGraphQLMultiError
+    from hubsrht.services.builds import TriggerCondition, Visibility
+    from hubsrht.services.builds import TriggerInput, EmailTriggerInput
+    from hubsrht.services.builds import TriggerType
+    from hubsrht.services.git import GitClient
+    from hubsrht.services.lists import ListsClient, ToolIcon
+    from yaml.error import YAMLError
 
     project = ml.project
     auth = InternalAuth(project.owner)
-    builds_client = BuildsClient(auth)
-    git_client = GitClient(auth)
-    lists_client = ListsClient(auth)
+    builds_client = pooled(BuildsClient, auth)
+    git_client = pooled(GitClient, auth)
 
     patch_id = patchset.id
     patch_url = f"{ml.url()}/patches/{patch_id}"
@@ -66,31 +135,17 @@ def submit_patchset(ml, patchset):
         # TODO: support for hg.sr.ht
         return None
 
-    repo = git_client.get_manifests(repo.owner.username, repo.name).user.repository
-    assert repo is not None
-
-    manifests = dict()
-    if repo.multiple:
-        for dirent in repo.multiple.object.entries.results:
-            if not dirent.object:
-                continue
-            if not any(fnmatch(dirent.name, pat) for pat in ["*.yml", "*.yaml"]):
-                continue
-            manifests[dirent.name] = dirent.object.text
-    elif repo.single_yml:
-        manifests[".build.yml"] = repo.single_yml.object.text
-    elif repo.single_yaml:
-        manifests[".build.yaml"] = repo.single_yaml.object.text
-    else:
+    manifests = get_manifests(git_client, repo)
+    if manifests is None:
         return None
+    repo_name = repo.name
+    repo_visibility = Visibility(repo.visibility.value)
 
     if len(manifests) > 4:
         keys = list(manifests.keys())
         random.shuffle(keys)
         manifests = { key: manifests[key] for key in keys[:4] }
 
-    ids = []
-
     version = patchset.version
     if version == 1:
         version = ""
@@ -111,15 +166,46 @@ def submit_patchset(ml, patchset):
 [0]: {ml.url()}/patches/{patch_id}
 [1]: mailto:{submitter[1]}"""
 
-    for key, value in manifests.items():
+    root = get_origin("hub.sr.ht", external=False)
+    owner_id = project.owner_id
+    owner_name = project.owner.canonical_name
+    ml_id = ml.id
+    ml_url = ml.url()
+
+    # The patches to apply are the same for every manifest, so any Depends-on
+    # patchsets are resolved once, by the first manifest which is submitted.
+    apply_script = None
+    apply_script_lock = threading.Lock()
+
+    def get_apply_script(lists_client):
+        nonlocal apply_script
+        with apply_script_lock:
+            if apply_script is None:
+                apply_script = _gen_apply_script(lists_client,
+                        ml_url, patchset)
+            return apply_script
+
+    def submit_manifest(key, value):
+        # Each manifest is submitted from its own thread, with its own session
+        # and clients
         try:
-            manifest = Manifest(yaml.safe_load(value))
+            auth = InternalAuth(db.session.get(User, owner_id))
+            return _submit_manifest(auth, key, value)
+        finally:
+            db.session.remove()
+
+    def _submit_manifest(auth, key, value):
+        builds_client = pooled(BuildsClient, auth)
+        lists_client = pooled(ListsClient, auth)
+
+        try:
+            manifest = Manifest(copy.deepcopy(_parse_manifest(value)))
         except YAMLError:
             lists_client.create_tool(
                     patchset_id=patch_id,
                     icon=ToolIcon.FAILED,
                     details=f"Failed to submit build: error parsing YAML")
-            continue
+            return None
 
         submit_build = True
         sub = manifest.submitter
@@ -128,16 +214,16 @@ def submit_patchset(ml, patchset):
             if "enabled" in hub_sub:
                 submit_build = hub_sub["enabled"]
         if not submit_build:
-            continue
+            return None
 
+        script = get_apply_script(lists_client)
         tool_id = lists_client.create_tool(
                 patchset_id=patch_id,
                 icon=ToolIcon.PENDING,
                 details=f"build pending: {key}").create_tool.id
 
-        apply_script = _gen_apply_script(lists_client, ml, patchset)
         task = Task({
-            "_apply_patch": apply_script,
+            "_apply_patch": script,
         })
         manifest.tasks.insert(0, task)
 
@@ -150,18 +236,20 @@ def submit_patchset(ml, patchset):
         manifest.environment.setdefault("PATCHSET_URL", patch_url)
 
         # Add webhook trigger
-        root = get_origin("hub.sr.ht", external=False)
         details = fernet.encrypt(json.dumps({
-            "mailing_list": ml.id,
+            "mailing_list": ml_id,
             "patchset_id": patch_id,
             "tool_id": tool_id,
             "name": key,
-            "user": project.owner.canonical_name,
+            "user": owner_name,
         }).encode()).decode()
         manifest.triggers.append(Trigger({
             "action": "webhook",
             "condition": "always",
-            "url": root + url_for("webhooks.build_complete", details=details),
+            # Outside of a request (e.g. in contrib/webhook-worker), url_for
+            # would return an external URL by default
+            "url": root + url_for("webhooks.build_complete",
+                details=details, _external=False),
         }))
 
         try:
@@ -169,23 +257,29 @@ def submit_patchset(ml, patchset):
             job = builds_client.submit_build(
                     manifest=manifest,
                     note=build_note,
-                    tags=[repo.name, "patches", key],
+                    tags=[repo_name, "patches", key],
                     execute=False,
-                    visibility=Visibility(repo.visibility.value)).submit
+                    visibility=repo_visibility).submit
         except GraphQLClientGraphQLMultiError as err:
             details = ", ".join([e.message for e in err.errors])
             lists_client.update_tool(
                     tool_id=tool_id,
                     icon=ToolIcon.FAILED,
                     details=f"Failed to submit build: {details}")
-            continue
+            return None
 
-        ids.append(job.id)
-        build_url = f"{buildsrht}/{project.owner.canonical_name}/job/{job.id}"
+        build_url = f"{buildsrht}/{owner_name}/job/{job.id}"
         lists_client.update_tool(
                 tool_id=tool_id,
                 icon=ToolIcon.WAITING,
                 details=f"[#{job.id}]({build_url}) running {key}")
+        return job.id
+
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SUBMISSIONS) as executor:
+        futures = [executor.submit(in_context(submit_manifest), key, value)
+                for key, value in manifests.items()]
+        ids = [f.result() for f in futures]
+    ids = [job_id for job_id in ids if job_id is not None]
 
     trigger = TriggerInput(
         type=TriggerType.EMAIL,
@@ -202,7 +296,7 @@ def submit_patchset(ml, patchset):
         note=build_note)
     return ids
 
-def _gen_apply_script(client, ml, patchset):
+def _gen_apply_script(client, ml_url, patchset):
     # Note: one may be tempted to replace the temporary file by piping curl
     # into git directly. Do not be misled! It is necessary to have two separate
     # commands so that a patch which fails to apply fails the build. pipefail
@@ -220,7 +314,7 @@ git config --global user.email 'builds@sr.ht'
             if key != "Depends-on":
                 continue
             patchset_url = value.strip()
-            match = _patchset_url_re.match(patchset_url)
+            match = _patchset_url_re().match(patchset_url)
             if not match:
                 continue
             if patchset_url in deps_seen:
@@ -233,7 +327,7 @@ curl -sS {quote(patchset_mbox)} >/tmp/patch
 git -C {quote(patch.prefix)} am -3 /tmp/patch
 """
 
-    patch_mbox = f"{ml.url()}/patches/{patchset.id}/mbox"
+    patch_mbox = f"{ml_url}/patches/{patchset.id}/mbox"
     script += f"""curl -sS {quote(patch_mbox)} >/tmp/patch
 git -C {quote(patchset.prefix)} am -3 /tmp/patch
 """
@@ -0,0 +1,41 @@
+"""
+Shared cache of pages rendered for logged-out visitors, so that bursts of
+anonymous traffic to the public pages are served without touching the
+database.
+"""
+from datetime import timedelta
+from flask import Response, make_response, request
+from functools import wraps
+from srht.oauth import current_user
+from srht.redis import redis
+
+# Anonymous pages are served from cache for at most this long
+PAGE_CACHE_TTL = timedelta(minutes=1)
+
+_generation_key = "hub.sr.ht:pagecache:generation"
+
+def anonymous_cache(f):
+    """
+    Serves the response of this view from cache for logged-out visitors.
+    Only successful GET responses are cached.
+    """
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if current_user or request.method != "GET":
+            return f(*args, **kwargs)
+
+        generation = int(redis.get(_generation_key) or 0)
+        key = f"hub.sr.ht:pagecache:{generation}:{request.full_path}"
+        cached = redis.get(key)
+        if cached is not None:
+            return Response(cached, mimetype="text/html")
+
+        res = make_response(f(*args, **kwargs))
+        if res.status_code == 200:
+            redis.setex(key, PAGE_CACHE_TTL, res.get_data())
+        return res
+    return wrapper
+
+def invalidate_pages():
+    """Discards all cached anonymous pages, e.g. after a public change."""
+    redis.incr(_generation_key)
@@ -4,7 +4,9 @@ from flask import url_for
 from flask import redirect
 from hubsrht.types import Project, User, Visibility
 from hubsrht.types import Redirect
+from sqlalchemy import func
 from srht.oauth import current_user
+from srht.search import search_by
 from enum import Enum
 
 class ProjectAccess(Enum):
@@ -56,3 +58,26 @@ def get_project_or_redir(owner, project_name, access, user=current_user):
         view_args["project_name"] = redir.new_project.name
         abort(redirect(url_for(request.endpoint, **view_args)))
     abort(404)
+
+def search_projects(projects, terms):
+    """
+    Filters a project query by search terms, where #tag or tag:tag matches
+    projects with that tag. Raises ValueError for invalid search terms.
+    """
+    return search_by(projects, terms,
+            [Project.name, Project.description],
+            key_fns={"tag": lambda t:
+                Project.search_tags.contains([t.lower()])},
+            term_map=lambda t: f"tag:{t[1:]}" if t.startswith("#") else t)
+
+def search_rank(terms):
+    """
+    Returns an expression which ranks projects by their relevance to the words
+    of these search terms, or None if there are no such words.
+    """
+    words = [t for t in terms.split()
+            if not t.startswith(("#", "-")) and ":" not in t]
+    if not words:
+        return None
+    query = func.websearch_to_tsquery("english", " or ".join(words))
+    return func.ts_rank(Project.search_vector, query)
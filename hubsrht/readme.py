@@ -0,0 +1,90 @@
+from datetime import timedelta
+from hubsrht.transport import pooled, render_timeout
+from hubsrht.types import RepoType
+from markupsafe import Markup, escape
+from srht.graphql import InternalAuth
+from srht.markdown import markdown, sanitize
+from srht.redis import redis
+
+# Rendered READMEs are kept for up to this long. Pushes to git repositories
+# invalidate them right away, but hg.sr.ht sends no push webhooks, so hg READMEs
+# are only refreshed on REPO_UPDATE and may lag behind a push by this much.
+README_CACHE_TTL = timedelta(hours=1)
+# If the upstream service fails, a stale README is served for up to this long.
+README_STALE_TTL = timedelta(days=7)
+
+def get_readme(owner, repo):
+    from hubsrht.services.git import GitClient
+    from hubsrht.services.hg import HgClient
+    auth = InternalAuth(owner)
+    html, plaintext, md = None, None, None
+
+    if repo.repo_type == RepoType.git:
+        blob_prefix = repo.url() + "/blob/HEAD/"
+        rendered_prefix = repo.url() + "/tree/HEAD/"
+
+        client = pooled(GitClient, auth, timeout=render_timeout)
+        git_repo = client.get_readme(owner.username, repo.name).user.repository
+        if not git_repo:
+            raise Exception(f"git.sr.ht returned no repository for {owner.username}/{repo.name}")
+        html = git_repo.html
+        if git_repo.plaintext:
+            plaintext = git_repo.plaintext.object.text
+        if git_repo.md or git_repo.markdown:
+            md = (git_repo.md or git_repo.markdown).object.text
+    elif repo.repo_type == RepoType.hg:
+        blob_prefix = repo.url() + "/raw/"
+        rendered_prefix = repo.url() + "/browse/"
+
+        client = pooled(HgClient, auth, timeout=render_timeout)
+        hg_repo = client.get_readme(owner.username, repo.name).user.repository
+        html = hg_repo.html
+        plaintext = hg_repo.plaintext
+        md = hg_repo.md or hg_repo.markdown
+
+    if html:
+        return Markup(sanitize(html))
+
+    if md:
+        html = markdown(md, link_prefix=[rendered_prefix, blob_prefix])
+        return Markup(html)
+
+    if plaintext:
+        return Markup(f"<pre>{escape(plaintext)}</pre>")
+
+    return None
+
+def _readme_cache_key(repo_type, remote_id):
+    return f"hub.sr.ht:readme:{repo_type.value}:{remote_id}"
+
+def get_cached_readme(owner, repo):
+    """
+    Like get_readme, but serves the rendered README from cache when possible.
+    If the upstream service fails, the last rendered README is returned, if
+    there is one.
+    """
+    key = _readme_cache_key(repo.repo_type, repo.remote_id)
+    cached = redis.get(key)
+    if cached is not None:
+        return Markup(cached.decode()) if cached else None
+
+    try:
+        readme = get_readme(owner, repo)
+    except Exception:
+        stale = redis.get(key + ":stale")
+        if stale is None:
+            raise
+        return Markup(stale.decode()) if stale else None
+
+    # An empty value records that the repository has no README
+    value = str(readme) if readme else ""
+    redis.setex(key, README_CACHE_TTL, value)
+    redis.setex(key + ":stale", README_STALE_TTL, value)
+    return readme
+
+def invalidate_readme(repo_type, remote_id):
+    """
+    Forces the README of this remote repository to be fetched on the next
+    view.
+    """
+    redis.delete(_readme_cache_key(repo_type, remote_id))
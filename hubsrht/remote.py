@@ -0,0 +1,93 @@
+import httpx
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from flask import copy_current_request_context, current_app
+from flask import has_request_context
+
+# Maximum number of remote resources offered on the "add resource" pages
+REMOTE_RESULTS_LIMIT = 100
+# Seconds allowed for fetching all pages of a remote listing
+REMOTE_LIST_DEADLINE = 10
+
+def in_context(f):
+    """
+    Wraps f so that it runs in a copy of the current request context (or
+    application context, outside of requests) when called from another thread.
+    Wrap the function once per task when running several tasks concurrently.
+    """
+    if has_request_context():
+        return copy_current_request_context(f)
+    app = current_app._get_current_object()
+    def wrapper(*args, **kwargs):
+        with app.app_context():
+            return f(*args, **kwargs)
+    return wrapper
+
+def iter_remote(fetch, deadline=None):
+    """
+    Iterates over every result of a paginated GraphQL query. fetch is called
+    with a cursor (None for the first page) and returns an object with results
+    and cursor attributes. The next page is fetched in the background while the
+    results of the current page are consumed.
+
+    If deadline (a time.monotonic() value) passes while waiting for a page,
+    concurrent.futures.TimeoutError is raised.
+    """
+    fetch = in_context(fetch)
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        future = executor.submit(fetch, None)
+        while future is not None:
+            remaining = None
+            if deadline is not None:
+                remaining = max(deadline - time.monotonic(), 0)
+            page = future.result(timeout=remaining)
+            if page.cursor:
+                future = executor.submit(fetch, page.cursor)
+            else:
+                future = None
+            yield from page.results
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _is_unavailable(ex):
+    """
+    Whether an error from a generated service client means that the upstream
+    is down or overloaded, rather than that the request was wrong.
+    """
+    if isinstance(ex, (httpx.TransportError, FutureTimeoutError)):
+        return True
+    # The HTTP errors raised by each generated client have their own class,
+    # but all of them carry the response
+    response = getattr(ex, "response", None)
+    return isinstance(response, httpx.Response) and response.status_code >= 500
+
+def list_remote(fetch, search=None, limit=REMOTE_RESULTS_LIMIT):
+    """
+    Returns up to limit results of a paginated GraphQL query whose name
+    contains search, most recently updated first, and whether there were more
+    results which were not fetched. Stops requesting pages once the limit is
+    reached.
+
+    If the upstream fails or is too slow, the results fetched so far are
+    returned and more is set, so that the page can still be rendered.
+    """
+    results = []
+    more = False
+    deadline = time.monotonic() + REMOTE_LIST_DEADLINE
+    try:
+        for result in iter_remote(fetch, deadline):
+            if search and search.lower() not in result.name.lower():
+                continue
+            if len(results) == limit:
+                more = True
+                break
+            results.append(result)
+    except Exception as ex:
+        if not _is_unavailable(ex):
+            raise
+        print(f"Error listing remote resources: {type(ex).__name__}: {ex}")
+        more = True
+    results.sort(key=lambda r: r.updated, reverse=True)
+    return results, more
@@ -0,0 +1,100 @@
+"""
+Coalesced updates of project.updated.
+
+Webhooks for busy projects arrive in bursts, and bumping the project's
+updated time in each of them serializes their transactions on the project
+row. Instead, touches are recorded in redis and written to the database in
+a single statement at most once per TOUCH_INTERVAL.
+
+When a flush is skipped because another one ran recently, one is scheduled
+in the background for when the interval ends, so that the last touches of a
+burst are written even if no other webhook arrives.
+"""
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.sql import text
+from srht.database import db
+from srht.redis import redis
+
+TOUCH_INTERVAL = timedelta(seconds=10)
+
+_pending_key = "hub.sr.ht:touched-projects"
+_flush_key = "hub.sr.ht:touched-projects:flushed"
+
+_deferred = None
+_deferred_lock = threading.Lock()
+
+def touch_project(project_id):
+    """Records that a project was updated now, to be written later."""
+    redis.hset(_pending_key, str(project_id), datetime.utcnow().isoformat())
+
+def flush_touches(force=False):
+    """
+    Writes pending project touches to the database, unless any worker has
+    done so in the last TOUCH_INTERVAL.
+    """
+    if not force and not redis.set(_flush_key, 1, nx=True, ex=TOUCH_INTERVAL):
+        _defer_flush()
+        return
+
+    # Take the pending touches atomically, so that touches recorded from now
+    # on are kept for the next flush
+    pipe = redis.pipeline()
+    pipe.hgetall(_pending_key)
+    pipe.delete(_pending_key)
+    pending, _ = pipe.execute()
+    if not pending:
+        return
+
+    # Lock the rows in a consistent order
+    touches = sorted((int(project_id), datetime.fromisoformat(updated.decode()))
+            for project_id, updated in pending.items())
+    try:
+        db.session.execute(text("""
+            UPDATE project SET updated = GREATEST(project.updated, t.updated)
+            FROM unnest(:ids, :times) AS t(id, updated)
+            WHERE project.id = t.id
+        """), {
+            "ids": [project_id for project_id, _ in touches],
+            "times": [updated for _, updated in touches],
+        })
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # Put them back, without overwriting newer touches
+        for project_id, updated in touches:
+            redis.hsetnx(_pending_key, str(project_id), updated.isoformat())
+        raise
+
+def _defer_flush():
+    """
+    Flushes the pending touches in the background once the current interval
+    ends, unless such a flush is already scheduled in this process.
+    """
+    global _deferred
+    if not redis.exists(_pending_key):
+        return
+    with _deferred_lock:
+        if _deferred is not None:
+            return
+        remaining = redis.pttl(_flush_key)
+        if remaining < 0:
+            remaining = TOUCH_INTERVAL.total_seconds() * 1000
+        app = current_app._get_current_object()
+        _deferred = threading.Timer(remaining / 1000, _deferred_flush, [app])
+        _deferred.daemon = True
+        _deferred.start()
+
+def _deferred_flush(app):
+    global _deferred
+    with _deferred_lock:
+        _deferred = None
+    with app.app_context():
+        try:
+            # Schedules another flush if this one is skipped as well
+            flush_touches()
+        except Exception as ex:
+            print(f"Error flushing project touches: {ex}")
+        finally:
+            db.session.remove()
@@ -6,6 +6,8 @@ _git_generated_prefixes = (
     "(cherry picked from commit ",
 )
 
+_trailer_re = re.compile(r"([A-Za-z\d][A-Za-z\d-]*)\s*:\s*(.*)")
+
 def commit_trailers(message: str) -> List[Tuple[str, str]]:
     """
     Extract the trailers from a commit message. Return a list of pairs of
@@ -16,20 +18,23 @@ def commit_trailers(message: str) -> List[Tuple[str, str]]:
     lines = message.strip().splitlines()
 
     # The first paragraph is the title and cannot be trailers
-    while lines and lines[0] != '':
-        del lines[0]
+    try:
+        start = lines.index("")
+    except ValueError:
+        return []
 
     recognized_prefix = False
     only_spaces = True
     trailer_lines = non_trailer_lines = 0
     possible_continuation_lines = 0
+    matches = dict()
 
     # Get the start of the trailers by looking starting from the end for a
     # blank line before a set of non-blank lines that (i) are all trailers, or
     # (ii) contains at least one Git-generated trailer and consists of at least
     # 25% trailers.
     i = len(lines) - 1
-    while i >= 0:
+    while i >= start:
         line = lines[i]
 
         if not line.strip():
@@ -47,14 +52,15 @@ def commit_trailers(message: str) -> List[Tuple[str, str]]:
 
         only_spaces = False
 
-        if any(line.startswith(p) for p in _git_generated_prefixes):
+        match = matches[i] = _trailer_re.fullmatch(line)
+        if line.startswith(_git_generated_prefixes):
             trailer_lines += 1
             possible_continuation_lines = 0
             recognized_prefix = True
-        elif re.search(r"^[A-Za-z\d][A-Za-z\d-]*\s*:", line):
+        elif match:
             trailer_lines += 1
             possible_continuation_lines = 0
-        elif line[0] in (" ", "\t"):
+        elif line[0] in " \t":
             possible_continuation_lines += 1
         else:
             non_trailer_lines += 1 + possible_continuation_lines
@@ -65,19 +71,20 @@ def commit_trailers(message: str) -> List[Tuple[str, str]]:
     # If a line does not match a trailer and starts with a space or tab, its
     # contents are appended to the current trailer value.
     trailers = []
-    name = value = None
+    name = None
+    value = []
 
-    for line in lines[i:]:
-        match = re.match(r"^([A-Za-z\d][A-Za-z\d-]*)\s*:\s*(.*)$", line)
+    for j in range(i, len(lines)):
+        match = matches[j]
         if match:
-            if name is not None and value is not None:
-                trailers.append((name, value))
+            if name is not None:
+                trailers.append((name, "\n".join(value)))
             name = match[1]
-            value = match[2]
-        elif name is not None and value is not None and line[0] in (" ", "\t"):
+            value = [match[2]]
+        elif name is not None and lines[j][0] in " \t":
             # continuation line
-            value += "\n" + line
-    if name is not None and value is not None:
-        trailers.append((name, value))
+            value.append(lines[j])
+    if name is not None:
+        trailers.append((name, "\n".join(value)))
 
     return trailers
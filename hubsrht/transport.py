@@ -0,0 +1,145 @@
+"""
+Process-wide keep-alive connection pools for requests made to other
+sourcehut services, shared by all GraphQL clients generated in
+hubsrht.services.
+
+Each upstream origin also has a circuit breaker: after a number of
+consecutive failures, requests to that upstream fail immediately with
+UpstreamUnavailable until a cooldown period has passed, so that one
+unresponsive service cannot tie up every hub.sr.ht worker.
+"""
+import httpx
+import threading
+import time
+from srht.config import cfgi
+from urllib.parse import urlsplit
+
+max_connections = cfgi("hub.sr.ht", "upstream-pool-connections", default=20)
+max_keepalive = cfgi("hub.sr.ht", "upstream-pool-keepalive", default=10)
+keepalive_expiry = cfgi("hub.sr.ht", "upstream-keepalive-expiry", default=30)
+# Seconds allowed for an upstream request, and for requests made while
+# rendering a page, which have less time to spare
+timeout = cfgi("hub.sr.ht", "upstream-timeout", default=30)
+render_timeout = cfgi("hub.sr.ht", "upstream-render-timeout", default=5)
+breaker_threshold = cfgi("hub.sr.ht", "upstream-breaker-threshold", default=5)
+breaker_cooldown = cfgi("hub.sr.ht", "upstream-breaker-cooldown", default=30)
+
+class UpstreamUnavailable(httpx.TransportError):
+    """Raised without contacting an upstream whose circuit breaker is open."""
+    pass
+
+class PooledTransport(httpx.HTTPTransport):
+    """
+    HTTP transport for one upstream origin which counts its requests and
+    stops sending them after repeated failures.
+    """
+    def __init__(self, origin):
+        super().__init__(limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry))
+        self.origin = origin
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0
+        self.open_until = None
+        self._lock = threading.Lock()
+
+    def _allow(self):
+        with self._lock:
+            if self.open_until is None:
+                return True
+            if time.monotonic() < self.open_until:
+                return False
+            # Half-open: let one request through to probe the upstream
+            self.open_until = time.monotonic() + breaker_cooldown
+            return True
+
+    def _record(self, ok):
+        with self._lock:
+            if ok:
+                self.failures = 0
+                self.open_until = None
+                return
+            self.errors += 1
+            self.failures += 1
+            if self.failures >= breaker_threshold:
+                self.open_until = time.monotonic() + breaker_cooldown
+
+    def handle_request(self, request):
+        if not self._allow():
+            raise UpstreamUnavailable(
+                    f"{self.origin} is unavailable after repeated errors",
+                    request=request)
+        with self._lock:
+            self.requests += 1
+        try:
+            response = super().handle_request(request)
+        except httpx.TransportError:
+            self._record(False)
+            raise
+        self._record(response.status_code < 500)
+        return response
+
+    def close(self):
+        # The pool outlives the clients which borrow it
+        pass
+
+    def stats(self):
+        connections = self._pool.connections
+        idle = sum(1 for conn in connections if conn.is_idle())
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "connections": len(connections),
+                "idle": idle,
+                "breaker_open": self.open_until is not None,
+            }
+
+class UpstreamTransport(httpx.BaseTransport):
+    """Sends each request through the shared transport for its origin."""
+    def handle_request(self, request):
+        return get_transport(request.url).handle_request(request)
+
+_transports = dict()
+_http_clients = dict()
+_lock = threading.Lock()
+
+def get_transport(url):
+    """Returns the shared transport for the origin of this URL."""
+    parts = urlsplit(str(url))
+    origin = f"{parts.scheme}://{parts.netloc}"
+    with _lock:
+        transport = _transports.get(origin)
+        if transport is None:
+            transport = _transports[origin] = PooledTransport(origin)
+        return transport
+
+def get_http_client(timeout=timeout):
+    """
+    Returns the shared httpx.Client for upstream requests with the given
+    timeout in seconds. It is built once per process, so its transports,
+    proxy mounts and SSL contexts are not set up again for every request.
+    """
+    with _lock:
+        http_client = _http_clients.get(timeout)
+        if http_client is None:
+            http_client = _http_clients[timeout] = httpx.Client(
+                    transport=UpstreamTransport(), timeout=timeout)
+        return http_client
+
+def pooled(client_class, *args, timeout=timeout, **kwargs):
+    """
+    Builds a generated service client whose requests go through the shared
+    connection pool for its upstream, with the given timeout in seconds. Pass
+    render_timeout for requests made while rendering a page. Other arguments,
+    such as the auth, are passed to the client class.
+    """
+    return client_class(*args, http_client=get_http_client(timeout), **kwargs)
+
+def stats():
+    """Returns connection pool statistics for each upstream origin."""
+    with _lock:
+        transports = list(_transports.values())
+    return {t.origin: t.stats() for t in transports}
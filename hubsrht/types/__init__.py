@@ -17,7 +17,10 @@ from hubsrht.types.eventprojectassoc import EventProjectAssociation
 from hubsrht.types.feature import Feature
 from hubsrht.types.mailinglist import MailingList
 from hubsrht.types.project import Project
+from hubsrht.types.projecttag import ProjectTag
 from hubsrht.types.redirect import Redirect
 from hubsrht.types.sourcerepo import SourceRepo, RepoType
+from hubsrht.types.ticketreference import TicketReference
 from hubsrht.types.tracker import Tracker
 from hubsrht.types.webhooks import UserWebhooks
+from hubsrht.types.webhookdelivery import WebhookDelivery
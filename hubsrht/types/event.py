@@ -1,7 +1,10 @@
+import hashlib
 import sqlalchemy as sa
 import sqlalchemy_utils as sau
 from enum import Enum
+from hubsrht.types import Visibility
 from hubsrht.types.eventprojectassoc import EventProjectAssociation
+from sqlalchemy.dialects import postgresql
 from srht.database import Base
 
 class EventType(Enum):
@@ -39,6 +42,10 @@ class Event(Base):
     tracker = sa.orm.relationship("Tracker", cascade="all, delete")
     """The ticket tracker implicated in this event, if applicable"""
 
+    visibility = sa.Column(postgresql.ENUM(Visibility),
+            nullable=False, server_default="PUBLIC")
+    """Visibility of the implicated resource, kept in sync by webhooks"""
+
     external_source = sa.Column(sa.Unicode) # e.g. "lists.sr.ht"
     external_summary = sa.Column(sa.Unicode) # markdown
     external_details = sa.Column(sa.Unicode) # markdown
@@ -46,8 +53,35 @@ class Event(Base):
     external_details_plain = sa.Column(sa.Unicode) # plaintext
     external_url = sa.Column(sa.Unicode)
 
+    dedupe_key = sa.Column(sa.LargeBinary)
+    """Hash identifying external events which are shared between projects"""
+
     projects = sa.orm.relationship(
         "Project",
         secondary=EventProjectAssociation.__table__,
         back_populates="events",
     )
+
+    @staticmethod
+    def load_details():
+        """
+        Loader options for lists of events, which load everything the event
+        templates display up front rather than with several queries per event.
+        """
+        from hubsrht.types import MailingList, Project, SourceRepo, Tracker
+        return [
+            sa.orm.joinedload(Event.user),
+            sa.orm.joinedload(Event.source_repo).joinedload(SourceRepo.owner),
+            sa.orm.joinedload(Event.mailing_list).joinedload(MailingList.owner),
+            sa.orm.joinedload(Event.tracker).joinedload(Tracker.owner),
+            sa.orm.selectinload(Event.projects).joinedload(Project.owner),
+        ]
+
+    @staticmethod
+    def dedupe_key_for(source, user_id, url):
+        """
+        Computes the dedupe key for an external event. Must match the
+        expression used to backfill the column in migration 0012.
+        """
+        key = f"{source}:{user_id if user_id is not None else ''}:{url}"
+        return hashlib.sha256(key.encode()).digest()
@@ -1,9 +1,59 @@
 import sqlalchemy as sa
 import sqlalchemy_utils as sau
+from functools import cached_property
 from sqlalchemy.dialects import postgresql
 from hubsrht.types import Visibility
 from hubsrht.types.eventprojectassoc import EventProjectAssociation
-from srht.database import Base
+from srht.database import Base, db
+
+class ResourceSummary:
+    """
+    The number of source repositories, mailing lists and trackers linked to a
+    project, for pages which do not need every one of them.
+    """
+    _tables = [
+        ("source_repos", "source_repo"),
+        ("mailing_lists", "mailing_list"),
+        ("trackers", "tracker"),
+    ]
+
+    def __init__(self, project):
+        selects = []
+        for kind, name in self._tables:
+            table = sa.table(name, sa.column("id"), sa.column("project_id"))
+            selects.append(sa.select(sa.literal(kind),
+                    sa.func.count(table.c.id), sa.func.min(table.c.id))
+                .where(table.c.project_id == project.id))
+        rows = db.session.execute(sa.union_all(*selects)).all()
+        self.counts = {kind: count for kind, count, _ in rows}
+        self._first = {kind: first for kind, _, first in rows}
+
+    @property
+    def source_repos(self):
+        return self.counts["source_repos"]
+
+    @property
+    def mailing_lists(self):
+        return self.counts["mailing_lists"]
+
+    @property
+    def trackers(self):
+        return self.counts["trackers"]
+
+    def only(self, kind):
+        """
+        Returns the resource of this kind if it is the only one linked to the
+        project, or None.
+        """
+        if self.counts[kind] != 1:
+            return None
+        from hubsrht.types import SourceRepo, MailingList, Tracker
+        cls = {
+            "source_repos": SourceRepo,
+            "mailing_lists": MailingList,
+            "trackers": Tracker,
+        }[kind]
+        return cls.query.get(self._first[kind])
 
 class Project(Base):
     __tablename__ = "project"
@@ -22,6 +72,12 @@ class Project(Base):
     description = sa.Column(sa.Unicode(512), nullable=False)
     tags = sa.Column(sa.ARRAY(sa.String(16), dimensions=1),
             nullable=False, server_default="{}")
+    # Search columns are maintained by the database
+    search_vector = sa.orm.deferred(sa.Column(postgresql.TSVECTOR,
+            sa.Computed("setweight(to_tsvector('english'::regconfig, name), 'A') || "
+                "setweight(to_tsvector('english'::regconfig, description), 'B')")))
+    search_tags = sa.orm.deferred(sa.Column(sa.ARRAY(sa.String, dimensions=1),
+            sa.Computed("lower_tags(tags)")))
     website = sa.Column(sa.Unicode)
     visibility = sa.Column(postgresql.ENUM(Visibility),
             nullable=False, server_default="UNLISTED")
@@ -40,3 +96,8 @@ class Project(Base):
         secondary=EventProjectAssociation.__table__,
         back_populates="projects",
     )
+
+    @cached_property
+    def resources(self):
+        """Resource counts for this project, queried at most once."""
+        return ResourceSummary(self)
@@ -0,0 +1,15 @@
+import sqlalchemy as sa
+from srht.database import Base
+
+class ProjectTag(Base):
+    """
+    The number of public projects with a given tag. This table is maintained
+    by a database trigger on the project table.
+    """
+    __tablename__ = "project_tag"
+    tag = sa.Column(sa.Unicode, primary_key=True)
+    """The tag, in lower case"""
+    count = sa.Column(sa.Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<ProjectTag {self.tag} {self.count}>"
@@ -0,0 +1,23 @@
+import sqlalchemy as sa
+from srht.database import Base
+
+class TicketReference(Base):
+    """
+    Records that a cross-reference to a commit or patch has been posted to a
+    todo.sr.ht ticket, so that it is never posted twice.
+    """
+    __tablename__ = "ticket_reference"
+    __table_args__ = (
+        sa.UniqueConstraint("ticket", "reference",
+            name="ticket_reference_unique"),
+    )
+    id = sa.Column(sa.Integer, primary_key=True)
+    created = sa.Column(sa.DateTime, nullable=False)
+
+    ticket = sa.Column(sa.Unicode, nullable=False)
+    """The ticket, as ~owner/tracker/ticket-id"""
+    reference = sa.Column(sa.Unicode, nullable=False)
+    """The commit or patch which was referenced, e.g. commit:<sha>"""
+
+    def __repr__(self):
+        return f"<TicketReference {self.ticket} {self.reference}>"
@@ -0,0 +1,28 @@
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from srht.database import Base
+
+class WebhookDelivery(Base):
+    """
+    An incoming webhook payload which has been verified and queued for
+    asynchronous processing.
+    """
+    __tablename__ = "webhook_delivery"
+    id = sa.Column(sa.Integer, primary_key=True)
+    created = sa.Column(sa.DateTime, nullable=False)
+
+    handler = sa.Column(sa.Unicode, nullable=False)
+    """Name of the webhook handler which processes this payload"""
+    resource_key = sa.Column(sa.Unicode, nullable=False)
+    """Deliveries sharing a resource key are processed in order"""
+    args = sa.Column(postgresql.JSONB, nullable=False, server_default="{}")
+    payload = sa.Column(sa.Unicode, nullable=False)
+
+    attempts = sa.Column(sa.Integer, nullable=False, server_default="0")
+    run_after = sa.Column(sa.DateTime, nullable=False)
+    lease_expires = sa.Column(sa.DateTime)
+    last_error = sa.Column(sa.Unicode)
+    failed = sa.Column(sa.DateTime)
+
+    def __repr__(self):
+        return f"<WebhookDelivery {self.id} {self.handler}>"
@@ -0,0 +1,116 @@
+import sqlalchemy as sa
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from hubsrht.types import User
+from srht.database import db
+from srht.redis import redis
+
+_generation_key = "hub.sr.ht:usercache:generation"
+
+class UserCache:
+    """
+    Process-wide LRU cache of the users resolved by webhook handlers, keyed by
+    username. A hit is attached to the current session without any SQL, where
+    oauth_service.lookup_user would query the user by name (and, for unknown
+    users, call meta.sr.ht).
+
+    Only column values are cached, never ORM instances, so that entries can be
+    shared between threads and sessions. Entries are evicted when the user is
+    updated or deleted by this process. Any process which commits such a change
+    also bumps a generation counter in redis, which discards the entries cached
+    by every other process. Entries also expire after ttl seconds.
+    """
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, username, generation):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and (entry[1] < time.monotonic()
+                    or entry[2] != generation):
+                del self._entries[username]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(username)
+            return entry[0]
+
+    def _put(self, username, values, generation):
+        with self._lock:
+            self._entries[username] = (values,
+                    time.monotonic() + self.ttl, generation)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def lookup_user(self, username):
+        """Equivalent to current_app.oauth_service.lookup_user(username)."""
+        # Read before the lookup, so that a change committed meanwhile
+        # discards what is cached here
+        generation = int(redis.get(_generation_key) or 0)
+        values = self._get(username, generation)
+        if values is not None:
+            return _attach(values)
+
+        user = current_app.oauth_service.lookup_user(username)
+        if user is not None:
+            self._put(username, _snapshot(user), generation)
+        return user
+
+    def invalidate(self, user_id):
+        """Evicts the entries of this user, whatever their username."""
+        with self._lock:
+            stale = [username for username, entry in self._entries.items()
+                    if entry[0]["id"] == user_id]
+            for username in stale:
+                del self._entries[username]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+def _snapshot(user):
+    return {attr.key: getattr(user, attr.key)
+            for attr in sa.inspect(User).column_attrs}
+
+def _attach(values):
+    # Rebuild the user as if it had been loaded by a query, and add it to the
+    # session without loading it again
+    user = sa.inspect(User).class_manager.new_instance()
+    for key, value in values.items():
+        setattr(user, key, value)
+    sa.orm.make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+user_cache = UserCache()
+
+@sa.event.listens_for(User, "after_update")
+@sa.event.listens_for(User, "after_delete")
+def _evict_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+    session = sa.orm.object_session(target)
+    if session is not None:
+        session.info["usercache_stale"] = True
+
+@sa.event.listens_for(sa.orm.Session, "after_commit")
+def _bump_generation(session):
+    # Only once the change is visible, so that other processes cannot cache
+    # the old row again under the new generation
+    if session.info.pop("usercache_stale", False):
+        redis.incr(_generation_key)
+
+def lookup_user(username):
+    return user_cache.lookup_user(username)
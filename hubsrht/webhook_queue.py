@@ -0,0 +1,106 @@
+"""
+Durable queue for incoming webhook deliveries.
+
+When webhook-queue is enabled, the webhook endpoints only verify the payload
+signature and store the payload here. The deliveries are then processed by
+contrib/webhook-worker. Deliveries which share a resource key are processed
+strictly in the order they were received.
+
+A delivery may be processed more than once: when its lease expires while its
+handler is still running, or when the worker exits after the handler has
+committed but before the delivery is deleted. Handlers must therefore be
+idempotent; events are inserted with a dedupe key for this reason.
+"""
+import traceback
+from datetime import datetime, timedelta
+from hubsrht.touch import flush_touches
+from hubsrht.types import WebhookDelivery
+from sqlalchemy.sql import text
+from srht.config import cfgb, cfgi
+from srht.database import db
+
+enabled = cfgb("hub.sr.ht", "webhook-queue", default=False)
+max_attempts = cfgi("hub.sr.ht", "webhook-queue-max-attempts", default=8)
+
+_lease = timedelta(minutes=5)
+
+def enqueue(handler, resource_key, payload, args):
+    """Store a verified webhook payload for later processing."""
+    delivery = WebhookDelivery()
+    delivery.created = datetime.utcnow()
+    delivery.handler = handler
+    delivery.resource_key = resource_key
+    delivery.args = args
+    delivery.payload = payload.decode("utf-8")
+    delivery.run_after = delivery.created
+    db.session.add(delivery)
+    db.session.commit()
+    return delivery
+
+def claim():
+    """
+    Lease the next delivery which is ready to run, or return None. Only the
+    oldest pending delivery for each resource key is eligible.
+    """
+    now = datetime.utcnow()
+    delivery_id = db.session.execute(text("""
+        UPDATE webhook_delivery
+        SET lease_expires = :lease_expires, attempts = attempts + 1
+        WHERE id = (
+            SELECT d.id FROM webhook_delivery d
+            WHERE d.failed IS NULL
+                AND d.run_after <= :now
+                AND (d.lease_expires IS NULL OR d.lease_expires < :now)
+                AND NOT EXISTS (
+                    SELECT 1 FROM webhook_delivery e
+                    WHERE e.resource_key = d.resource_key
+                        AND e.failed IS NULL
+                        AND e.id < d.id)
+            ORDER BY d.id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED)
+        RETURNING id
+    """), {"now": now, "lease_expires": now + _lease}).scalar()
+    db.session.commit()
+    if delivery_id is None:
+        return None
+    return WebhookDelivery.query.get(delivery_id)
+
+def _backoff(attempts):
+    return timedelta(seconds=min(15 * 2 ** attempts, 60 * 60))
+
+def process(handlers):
+    """
+    Process one queued delivery with the matching handler from handlers.
+    Returns False if there was nothing to do.
+    """
+    delivery = claim()
+    if delivery is None:
+        return False
+
+    delivery_id = delivery.id
+    handler = handlers.get(delivery.handler)
+    try:
+        if handler is None:
+            raise Exception(f"Unknown webhook handler {delivery.handler}")
+        handler(delivery.payload.encode("utf-8"), **delivery.args)
+    except Exception:
+        db.session.rollback()
+        delivery = WebhookDelivery.query.get(delivery_id)
+        delivery.last_error = traceback.format_exc()
+        delivery.lease_expires = None
+        if delivery.attempts >= max_attempts:
+            print(f"Giving up on {delivery}:\n{delivery.last_error}")
+            delivery.failed = datetime.utcnow()
+        else:
+            delivery.run_after = datetime.utcnow() + _backoff(delivery.attempts)
+        db.session.commit()
+        return True
+
+    db.session.rollback()
+    (WebhookDelivery.query
+        .filter(WebhookDelivery.id == delivery_id)
+        .delete())
+    db.session.commit()
+    flush_touches()
+    return True
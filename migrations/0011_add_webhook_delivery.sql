@@ -0,0 +1,24 @@
+-- +brant Up
+CREATE TABLE webhook_delivery (
+	id serial PRIMARY KEY,
+	created timestamp without time zone NOT NULL,
+	handler character varying NOT NULL,
+	resource_key character varying NOT NULL,
+	args jsonb DEFAULT '{}'::jsonb NOT NULL,
+	payload character varying NOT NULL,
+	attempts integer DEFAULT 0 NOT NULL,
+	run_after timestamp without time zone NOT NULL,
+	lease_expires timestamp without time zone,
+	last_error character varying,
+	failed timestamp without time zone
+);
+
+CREATE INDEX webhook_delivery_pending_idx
+	ON webhook_delivery (resource_key, id)
+	WHERE failed IS NULL;
+CREATE INDEX webhook_delivery_run_after_idx
+	ON webhook_delivery (run_after)
+	WHERE failed IS NULL;
+
+-- +brant Down
+DROP TABLE webhook_delivery;
@@ -0,0 +1,24 @@
+-- +brant Up
+ALTER TABLE event ADD COLUMN dedupe_key bytea;
+
+-- Only the oldest of any pre-existing duplicates receives a key
+UPDATE event
+SET dedupe_key = digest(
+	external_source || ':' ||
+	coalesce(user_id::text, '') || ':' ||
+	external_url, 'sha256')
+WHERE id IN (
+	SELECT min(id) FROM event
+	WHERE event_type = 'external_event'
+		AND external_source IN ('git.sr.ht', 'lists.sr.ht')
+		AND external_url IS NOT NULL
+	GROUP BY external_source, user_id, external_url
+);
+
+CREATE UNIQUE INDEX event_dedupe_key_idx
+	ON event (dedupe_key)
+	WHERE dedupe_key IS NOT NULL;
+
+-- +brant Down
+DROP INDEX event_dedupe_key_idx;
+ALTER TABLE event DROP COLUMN dedupe_key;
@@ -0,0 +1,20 @@
+-- +brant Up
+DELETE FROM event_project_association a
+USING event_project_association b
+WHERE a.ctid < b.ctid
+	AND a.event_id = b.event_id
+	AND a.project_id = b.project_id;
+
+ALTER TABLE event_project_association
+	ADD PRIMARY KEY (project_id, event_id);
+
+CREATE INDEX event_project_association_event_id_idx
+	ON event_project_association (event_id);
+
+CREATE INDEX event_created_id_idx ON event (created, id);
+
+-- +brant Down
+DROP INDEX event_created_id_idx;
+DROP INDEX event_project_association_event_id_idx;
+ALTER TABLE event_project_association
+	DROP CONSTRAINT event_project_association_pkey;
@@ -0,0 +1,24 @@
+-- +brant Up
+ALTER TABLE event
+	ADD COLUMN visibility visibility DEFAULT 'PUBLIC'::visibility NOT NULL;
+
+UPDATE event SET visibility = r.visibility
+FROM source_repo r WHERE event.source_repo_id = r.id;
+UPDATE event SET visibility = l.visibility
+FROM mailing_list l WHERE event.mailing_list_id = l.id;
+UPDATE event SET visibility = t.visibility
+FROM tracker t WHERE event.tracker_id = t.id;
+
+CREATE INDEX event_public_created_id_idx
+	ON event (created, id)
+	WHERE visibility = 'PUBLIC';
+CREATE INDEX event_source_repo_id_idx ON event (source_repo_id);
+CREATE INDEX event_mailing_list_id_idx ON event (mailing_list_id);
+CREATE INDEX event_tracker_id_idx ON event (tracker_id);
+
+-- +brant Down
+DROP INDEX event_tracker_id_idx;
+DROP INDEX event_mailing_list_id_idx;
+DROP INDEX event_source_repo_id_idx;
+DROP INDEX event_public_created_id_idx;
+ALTER TABLE event DROP COLUMN visibility;
@@ -0,0 +1,11 @@
+-- +brant Up
+CREATE TABLE ticket_reference (
+	id serial PRIMARY KEY,
+	created timestamp without time zone NOT NULL,
+	ticket character varying NOT NULL,
+	reference character varying NOT NULL,
+	CONSTRAINT ticket_reference_unique UNIQUE (ticket, reference)
+);
+
+-- +brant Down
+DROP TABLE ticket_reference;
@@ -0,0 +1,32 @@
+-- +brant Up
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- +brant StatementBegin
+CREATE FUNCTION lower_tags(tags character varying[]) RETURNS character varying[]
+    AS $$
+        SELECT ARRAY(SELECT lower(t) FROM unnest(tags) t)::character varying[];
+    $$ LANGUAGE SQL IMMUTABLE;
+-- +brant StatementEnd
+
+ALTER TABLE project
+	ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+		setweight(to_tsvector('english'::regconfig, name), 'A') ||
+		setweight(to_tsvector('english'::regconfig, description), 'B')
+	) STORED,
+	ADD COLUMN search_tags character varying[] GENERATED ALWAYS AS (
+		lower_tags(tags)
+	) STORED;
+
+CREATE INDEX project_name_trgm_idx
+	ON project USING gin (name gin_trgm_ops);
+CREATE INDEX project_description_trgm_idx
+	ON project USING gin (description gin_trgm_ops);
+CREATE INDEX project_search_tags_idx
+	ON project USING gin (search_tags);
+
+-- +brant Down
+DROP INDEX project_search_tags_idx;
+DROP INDEX project_description_trgm_idx;
+DROP INDEX project_name_trgm_idx;
+ALTER TABLE project DROP COLUMN search_tags, DROP COLUMN search_vector;
+DROP FUNCTION lower_tags;
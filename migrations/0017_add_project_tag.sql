@@ -0,0 +1,42 @@
+-- +brant Up
+CREATE TABLE project_tag (
+	tag character varying NOT NULL PRIMARY KEY,
+	count integer NOT NULL
+);
+
+CREATE INDEX project_tag_count_idx ON project_tag (count DESC, tag);
+
+INSERT INTO project_tag (tag, count)
+SELECT t.tag, count(DISTINCT p.id)
+FROM project p, unnest(lower_tags(p.tags)) AS t(tag)
+WHERE p.visibility = 'PUBLIC'
+GROUP BY t.tag;
+
+-- +brant StatementBegin
+CREATE FUNCTION project_tag_update() RETURNS trigger
+    AS $$
+    BEGIN
+	IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.visibility = 'PUBLIC' THEN
+		UPDATE project_tag SET count = count - 1
+		WHERE tag = ANY(lower_tags(OLD.tags));
+		DELETE FROM project_tag
+		WHERE tag = ANY(lower_tags(OLD.tags)) AND count <= 0;
+	END IF;
+	IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.visibility = 'PUBLIC' THEN
+		INSERT INTO project_tag (tag, count)
+		SELECT DISTINCT t.tag, 1 FROM unnest(lower_tags(NEW.tags)) AS t(tag)
+		ON CONFLICT (tag) DO UPDATE SET count = project_tag.count + 1;
+	END IF;
+	RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+-- +brant StatementEnd
+
+CREATE TRIGGER project_tag_update
+	AFTER INSERT OR DELETE OR UPDATE OF tags, visibility ON project
+	FOR EACH ROW EXECUTE FUNCTION project_tag_update();
+
+-- +brant Down
+DROP TRIGGER project_tag_update ON project;
+DROP FUNCTION project_tag_update;
+DROP TABLE project_tag;
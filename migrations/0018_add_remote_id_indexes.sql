@@ -0,0 +1,10 @@
+-- +brant Up
+CREATE INDEX source_repo_repo_type_remote_id_idx
+	ON source_repo (repo_type, remote_id);
+CREATE INDEX mailing_list_remote_id_idx ON mailing_list (remote_id);
+CREATE INDEX tracker_remote_id_idx ON tracker (remote_id);
+
+-- +brant Down
+DROP INDEX tracker_remote_id_idx;
+DROP INDEX mailing_list_remote_id_idx;
+DROP INDEX source_repo_repo_type_remote_id_idx;
@@ -0,0 +1,117 @@
+-- +brant Up
+-- Projects of suspended users are not listed, so do not count them either
+-- +brant StatementBegin
+CREATE OR REPLACE FUNCTION project_tag_update() RETURNS trigger
+    AS $$
+    BEGIN
+	IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.visibility = 'PUBLIC'
+			AND NOT EXISTS (SELECT 1 FROM "user" u
+				WHERE u.id = OLD.owner_id AND u.user_type = 'SUSPENDED') THEN
+		UPDATE project_tag SET count = count - 1
+		WHERE tag = ANY(lower_tags(OLD.tags));
+		DELETE FROM project_tag
+		WHERE tag = ANY(lower_tags(OLD.tags)) AND count <= 0;
+	END IF;
+	IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.visibility = 'PUBLIC'
+			AND NOT EXISTS (SELECT 1 FROM "user" u
+				WHERE u.id = NEW.owner_id AND u.user_type = 'SUSPENDED') THEN
+		INSERT INTO project_tag (tag, count)
+		SELECT DISTINCT t.tag, 1 FROM unnest(lower_tags(NEW.tags)) AS t(tag)
+		ON CONFLICT (tag) DO UPDATE SET count = project_tag.count + 1;
+	END IF;
+	RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+-- +brant StatementEnd
+
+DROP TRIGGER project_tag_update ON project;
+CREATE TRIGGER project_tag_update
+	AFTER INSERT OR DELETE OR UPDATE OF tags, visibility, owner_id ON project
+	FOR EACH ROW EXECUTE FUNCTION project_tag_update();
+
+-- +brant StatementBegin
+CREATE FUNCTION project_tag_user_update() RETURNS trigger
+    AS $$
+    DECLARE
+	delta integer;
+    BEGIN
+	IF TG_OP = 'DELETE' THEN
+		-- The projects of a deleted user are deleted next, and uncounted
+		-- by project_tag_update as if the user was not suspended
+		IF OLD.user_type <> 'SUSPENDED' THEN
+			RETURN OLD;
+		END IF;
+		delta := 1;
+	ELSIF (OLD.user_type = 'SUSPENDED') = (NEW.user_type = 'SUSPENDED') THEN
+		RETURN NULL;
+	ELSIF NEW.user_type = 'SUSPENDED' THEN
+		delta := -1;
+	ELSE
+		delta := 1;
+	END IF;
+
+	INSERT INTO project_tag (tag, count)
+	SELECT t.tag, delta * count(DISTINCT p.id)
+	FROM project p, unnest(lower_tags(p.tags)) AS t(tag)
+	WHERE p.owner_id = OLD.id AND p.visibility = 'PUBLIC'
+	GROUP BY t.tag
+	ON CONFLICT (tag) DO UPDATE SET count = project_tag.count + EXCLUDED.count;
+	DELETE FROM project_tag WHERE count <= 0;
+	RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+-- +brant StatementEnd
+
+CREATE TRIGGER project_tag_user_update
+	AFTER UPDATE OF user_type ON "user"
+	FOR EACH ROW EXECUTE FUNCTION project_tag_user_update();
+
+CREATE TRIGGER project_tag_user_delete
+	BEFORE DELETE ON "user"
+	FOR EACH ROW EXECUTE FUNCTION project_tag_user_update();
+
+DELETE FROM project_tag;
+INSERT INTO project_tag (tag, count)
+SELECT t.tag, count(DISTINCT p.id)
+FROM project p
+JOIN "user" u ON u.id = p.owner_id,
+unnest(lower_tags(p.tags)) AS t(tag)
+WHERE p.visibility = 'PUBLIC' AND u.user_type <> 'SUSPENDED'
+GROUP BY t.tag;
+
+-- +brant Down
+DROP TRIGGER project_tag_user_delete ON "user";
+DROP TRIGGER project_tag_user_update ON "user";
+DROP FUNCTION project_tag_user_update;
+
+DROP TRIGGER project_tag_update ON project;
+CREATE TRIGGER project_tag_update
+	AFTER INSERT OR DELETE OR UPDATE OF tags, visibility ON project
+	FOR EACH ROW EXECUTE FUNCTION project_tag_update();
+
+-- +brant StatementBegin
+CREATE OR REPLACE FUNCTION project_tag_update() RETURNS trigger
+    AS $$
+    BEGIN
+	IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.visibility = 'PUBLIC' THEN
+		UPDATE project_tag SET count = count - 1
+		WHERE tag = ANY(lower_tags(OLD.tags));
+		DELETE FROM project_tag
+		WHERE tag = ANY(lower_tags(OLD.tags)) AND count <= 0;
+	END IF;
+	IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.visibility = 'PUBLIC' THEN
+		INSERT INTO project_tag (tag, count)
+		SELECT DISTINCT t.tag, 1 FROM unnest(lower_tags(NEW.tags)) AS t(tag)
+		ON CONFLICT (tag) DO UPDATE SET count = project_tag.count + 1;
+	END IF;
+	RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+-- +brant StatementEnd
+
+DELETE FROM project_tag;
+INSERT INTO project_tag (tag, count)
+SELECT t.tag, count(DISTINCT p.id)
+FROM project p, unnest(lower_tags(p.tags)) AS t(tag)
+WHERE p.visibility = 'PUBLIC'
+GROUP BY t.tag;
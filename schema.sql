@@ -1,4 +1,5 @@
 CREATE EXTENSION IF NOT EXISTS pgcrypto;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Note: PostgreSQL 18 includes native support for UUID v7
 -- Replace this when we roll it out
@@ -14,6 +15,11 @@ CREATE FUNCTION gen_uuidv7() RETURNS uuid
 	)::uuid;
     $$ LANGUAGE SQL;
 
+CREATE FUNCTION lower_tags(tags character varying[]) RETURNS character varying[]
+    AS $$
+        SELECT ARRAY(SELECT lower(t) FROM unnest(tags) t)::character varying[];
+    $$ LANGUAGE SQL IMMUTABLE;
+
 CREATE TYPE visibility AS ENUM (
 	'PUBLIC',
 	'PRIVATE',
@@ -81,9 +87,97 @@ CREATE TABLE project (
 	checklist_complete boolean DEFAULT false NOT NULL,
 	summary_repo_id integer,
 	tags character varying(16)[] DEFAULT '{}'::character varying[] NOT NULL,
+	search_vector tsvector GENERATED ALWAYS AS (
+		setweight(to_tsvector('english'::regconfig, name), 'A') ||
+		setweight(to_tsvector('english'::regconfig, description), 'B')
+	) STORED,
+	search_tags character varying[] GENERATED ALWAYS AS (
+		lower_tags(tags)
+	) STORED,
 	UNIQUE (owner_id, name)
 );
 
+CREATE INDEX project_name_trgm_idx
+	ON project USING gin (name gin_trgm_ops);
+CREATE INDEX project_description_trgm_idx
+	ON project USING gin (description gin_trgm_ops);
+CREATE INDEX project_search_tags_idx
+	ON project USING gin (search_tags);
+
+-- Number of public projects of unsuspended users with each (lowercased) tag,
+-- maintained by the project_tag_update and project_tag_user_update triggers
+CREATE TABLE project_tag (
+	tag character varying NOT NULL PRIMARY KEY,
+	count integer NOT NULL
+);
+
+CREATE INDEX project_tag_count_idx ON project_tag (count DESC, tag);
+
+CREATE FUNCTION project_tag_update() RETURNS trigger
+    AS $$
+    BEGIN
+	IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.visibility = 'PUBLIC'
+			AND NOT EXISTS (SELECT 1 FROM "user" u
+				WHERE u.id = OLD.owner_id AND u.user_type = 'SUSPENDED') THEN
+		UPDATE project_tag SET count = count - 1
+		WHERE tag = ANY(lower_tags(OLD.tags));
+		DELETE FROM project_tag
+		WHERE tag = ANY(lower_tags(OLD.tags)) AND count <= 0;
+	END IF;
+	IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.visibility = 'PUBLIC'
+			AND NOT EXISTS (SELECT 1 FROM "user" u
+				WHERE u.id = NEW.owner_id AND u.user_type = 'SUSPENDED') THEN
+		INSERT INTO project_tag (tag, count)
+		SELECT DISTINCT t.tag, 1 FROM unnest(lower_tags(NEW.tags)) AS t(tag)
+		ON CONFLICT (tag) DO UPDATE SET count = project_tag.count + 1;
+	END IF;
+	RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+CREATE TRIGGER project_tag_update
+	AFTER INSERT OR DELETE OR UPDATE OF tags, visibility, owner_id ON project
+	FOR EACH ROW EXECUTE FUNCTION project_tag_update();
+
+CREATE FUNCTION project_tag_user_update() RETURNS trigger
+    AS $$
+    DECLARE
+	delta integer;
+    BEGIN
+	IF TG_OP = 'DELETE' THEN
+		-- The projects of a deleted user are deleted next, and uncounted
+		-- by project_tag_update as if the user was not suspended
+		IF OLD.user_type <> 'SUSPENDED' THEN
+			RETURN OLD;
+		END IF;
+		delta := 1;
+	ELSIF (OLD.user_type = 'SUSPENDED') = (NEW.user_type = 'SUSPENDED') THEN
+		RETURN NULL;
+	ELSIF NEW.user_type = 'SUSPENDED' THEN
+		delta := -1;
+	ELSE
+		delta := 1;
+	END IF;
+
+	INSERT INTO project_tag (tag, count)
+	SELECT t.tag, delta * count(DISTINCT p.id)
+	FROM project p, unnest(lower_tags(p.tags)) AS t(tag)
+	WHERE p.owner_id = OLD.id AND p.visibility = 'PUBLIC'
+	GROUP BY t.tag
+	ON CONFLICT (tag) DO UPDATE SET count = project_tag.count + EXCLUDED.count;
+	DELETE FROM project_tag WHERE count <= 0;
+	RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+
+CREATE TRIGGER project_tag_user_update
+	AFTER UPDATE OF user_type ON "user"
+	FOR EACH ROW EXECUTE FUNCTION project_tag_user_update();
+
+CREATE TRIGGER project_tag_user_delete
+	BEFORE DELETE ON "user"
+	FOR EACH ROW EXECUTE FUNCTION project_tag_user_update();
+
 CREATE TABLE features (
 	id serial PRIMARY KEY,
 	created timestamp without time zone NOT NULL,
@@ -107,6 +201,8 @@ CREATE TABLE mailing_list (
 	webhook_version integer NOT NULL
 );
 
+CREATE INDEX mailing_list_remote_id_idx ON mailing_list (remote_id);
+
 CREATE TABLE source_repo (
 	id serial PRIMARY KEY,
 	remote_id integer NOT NULL,
@@ -125,6 +221,9 @@ CREATE TABLE source_repo (
 	CONSTRAINT project_source_repo_unique UNIQUE (project_id, remote_id, repo_type)
 );
 
+CREATE INDEX source_repo_repo_type_remote_id_idx
+	ON source_repo (repo_type, remote_id);
+
 ALTER TABLE project
 	ADD CONSTRAINT project_summary_repo_id_fkey FOREIGN KEY (summary_repo_id) REFERENCES source_repo(id) ON DELETE SET NULL;
 
@@ -144,6 +243,8 @@ CREATE TABLE tracker (
 	webhook_version integer NOT NULL
 );
 
+CREATE INDEX tracker_remote_id_idx ON tracker (remote_id);
+
 CREATE TABLE event (
 	id serial PRIMARY KEY,
 	created timestamp without time zone NOT NULL,
@@ -152,17 +253,43 @@ CREATE TABLE event (
 	source_repo_id integer REFERENCES source_repo(id) ON DELETE CASCADE,
 	mailing_list_id integer REFERENCES mailing_list(id) ON DELETE CASCADE,
 	tracker_id integer REFERENCES tracker(id) ON DELETE CASCADE,
+	visibility visibility DEFAULT 'PUBLIC'::visibility NOT NULL,
 	external_source character varying,
 	external_summary character varying,
 	external_details character varying,
 	external_summary_plain character varying,
 	external_details_plain character varying,
-	external_url character varying
+	external_url character varying,
+	dedupe_key bytea
 );
 
+CREATE UNIQUE INDEX event_dedupe_key_idx
+	ON event (dedupe_key)
+	WHERE dedupe_key IS NOT NULL;
+
+CREATE INDEX event_created_id_idx ON event (created, id);
+CREATE INDEX event_public_created_id_idx
+	ON event (created, id)
+	WHERE visibility = 'PUBLIC';
+CREATE INDEX event_source_repo_id_idx ON event (source_repo_id);
+CREATE INDEX event_mailing_list_id_idx ON event (mailing_list_id);
+CREATE INDEX event_tracker_id_idx ON event (tracker_id);
+
 CREATE TABLE event_project_association (
 	event_id integer NOT NULL REFERENCES event(id) ON DELETE CASCADE,
-	project_id integer NOT NULL REFERENCES project(id) ON DELETE CASCADE
+	project_id integer NOT NULL REFERENCES project(id) ON DELETE CASCADE,
+	PRIMARY KEY (project_id, event_id)
+);
+
+CREATE INDEX event_project_association_event_id_idx
+	ON event_project_association (event_id);
+
+CREATE TABLE ticket_reference (
+	id serial PRIMARY KEY,
+	created timestamp without time zone NOT NULL,
+	ticket character varying NOT NULL,
+	reference character varying NOT NULL,
+	CONSTRAINT ticket_reference_unique UNIQUE (ticket, reference)
 );
 
 CREATE TABLE redirect (
@@ -172,3 +299,24 @@ CREATE TABLE redirect (
 	owner_id integer NOT NULL REFERENCES "user"(id) ON DELETE CASCADE,
 	new_project_id integer NOT NULL REFERENCES project(id) ON DELETE CASCADE
 );
+
+CREATE TABLE webhook_delivery (
+	id serial PRIMARY KEY,
+	created timestamp without time zone NOT NULL,
+	handler character varying NOT NULL,
+	resource_key character varying NOT NULL,
+	args jsonb DEFAULT '{}'::jsonb NOT NULL,
+	payload character varying NOT NULL,
+	attempts integer DEFAULT 0 NOT NULL,
+	run_after timestamp without time zone NOT NULL,
+	lease_expires timestamp without time zone,
+	last_error character varying,
+	failed timestamp without time zone
+);
+
+CREATE INDEX webhook_delivery_pending_idx
+	ON webhook_delivery (resource_key, id)
+	WHERE failed IS NULL;
+CREATE INDEX webhook_delivery_run_after_idx
+	ON webhook_delivery (run_after)
+	WHERE failed IS NULL;